@@ -0,0 +1,216 @@
+from sudoku_geometry import get_geometry
+
+
+class DancingLinks:
+	"""
+	An exact cover solver using Knuth's Algorithm X with dancing links.
+	The matrix is held in flat lists of links rather than node objects: index 0 is the root,
+	indexes 1 to column_count are the column headers and every index after that is a node in a row.
+	"""
+
+	def __init__(self, column_count):
+		"""
+		:param column_count: The number of columns (constraints) in the exact cover matrix.
+		"""
+		self.column_count = column_count
+		headers = range(column_count + 1)
+		self.left = [i - 1 for i in headers]
+		self.left[0] = column_count
+		self.right = [i + 1 for i in headers]
+		self.right[column_count] = 0
+		self.up = list(headers)
+		self.down = list(headers)
+		self.column = list(headers)
+		self.size = [0] * (column_count + 1)
+		# the row id of every node, headers have no row
+		self.row_id = [None] * (column_count + 1)
+		# the number of rows selected by the search and the deepest level it reached
+		self.nodes = 0
+		self.max_depth = 0
+
+	def add_row(self, columns, row_id):
+		"""
+		Adds a row to the matrix.
+
+		:param columns: The columns (numbered from 0) which the row covers.
+		:param row_id: The value returned in a solution when this row is selected.
+		:return: None
+		"""
+		first = len(self.column)
+		for i, c in enumerate(columns):
+			header = c + 1
+			node = first + i
+			self.column.append(header)
+			self.row_id.append(row_id)
+			self.up.append(self.up[header])
+			self.down.append(header)
+			self.down[self.up[header]] = node
+			self.up[header] = node
+			self.size[header] += 1
+			self.left.append(node - 1 if i else first + len(columns) - 1)
+			self.right.append(node + 1 if i < len(columns) - 1 else first)
+
+	def __cover(self, header):
+		left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+		right[left[header]] = right[header]
+		left[right[header]] = left[header]
+		i = down[header]
+		while i != header:
+			j = right[i]
+			while j != i:
+				down[up[j]] = down[j]
+				up[down[j]] = up[j]
+				size[column[j]] -= 1
+				j = right[j]
+			i = down[i]
+
+	def __uncover(self, header):
+		left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+		i = up[header]
+		while i != header:
+			j = left[i]
+			while j != i:
+				size[column[j]] += 1
+				down[up[j]] = j
+				up[down[j]] = j
+				j = left[j]
+			i = up[i]
+		right[left[header]] = header
+		left[right[header]] = header
+
+	def __select(self, node):
+		"""
+		Covers the other columns of the row containing node, after its own column has been covered.
+		"""
+		j = self.right[node]
+		while j != node:
+			self.__cover(self.column[j])
+			j = self.right[j]
+
+	def __deselect(self, node):
+		j = self.left[node]
+		while j != node:
+			self.__uncover(self.column[j])
+			j = self.left[j]
+
+	def __choose_column(self):
+		"""
+		Finds the uncovered column with the fewest rows.
+
+		:return: The header index of the column.
+		"""
+		right, size = self.right, self.size
+		best = right[0]
+		best_size = size[best]
+		c = right[best]
+		while c and best_size > 1:
+			if size[c] < best_size:
+				best = c
+				best_size = size[c]
+			c = right[c]
+		return best
+
+	def solutions(self, cancel_event=None):
+		"""
+		Generates every exact cover of the matrix.
+		The search is iterative so that large matrices are not limited by the recursion limit,
+		and it only continues past a solution when the next one is requested.
+
+		:param cancel_event: A threading.Event which stops the search when it is set, checked every few hundred rows.
+		:return: A generator of lists of the row ids making up each solution.
+		"""
+		down, column = self.down, self.column
+		# the node of the row selected at each level of the search
+		selected = []
+		descending = True
+		while True:
+			if descending:
+				if not self.right[0]:
+					yield [self.row_id[node] for node in selected]
+					descending = False
+					continue
+				header = self.__choose_column()
+				self.__cover(header)
+				node = down[header]
+				if node == header:
+					self.__uncover(header)
+					descending = False
+					continue
+				selected.append(node)
+				self.__select(node)
+				self.nodes += 1
+				if not self.nodes & 0xFF and cancel_event is not None and cancel_event.is_set():
+					return
+				if len(selected) > self.max_depth:
+					self.max_depth = len(selected)
+				continue
+
+			# backtrack to the deepest level with another row left to try
+			if not selected:
+				return
+			node = selected.pop()
+			self.__deselect(node)
+			header = column[node]
+			node = down[node]
+			if node == header:
+				self.__uncover(header)
+				continue
+			selected.append(node)
+			self.__select(node)
+			self.nodes += 1
+			if not self.nodes & 0xFF and cancel_event is not None and cancel_event.is_set():
+				return
+			descending = True
+
+
+def sudoku_solutions(side_length, values, stats=None, cancel_event=None):
+	"""
+	Generates the solutions of a sudoku puzzle by solving it as an exact cover problem.
+	Each (tile, value) pair is a row which covers four constraints: the tile is filled, and the value
+	is placed once in the tile's row, column and subgrid.
+
+	:param side_length: The side length of the puzzle.
+	:param values: The tile values of the puzzle in row-major order. Empty tiles are 0.
+	:param stats: A SolveStats to record the search's nodes and depth into when the generator is closed or exhausted.
+	:param cancel_event: A threading.Event which stops the search when it is set, as if there were no more solutions.
+	:return: A generator of solutions, each a list of tile values in row-major order.
+	"""
+	n = side_length
+	geometry = get_geometry(n)
+	tile_count = n * n
+	matrix = DancingLinks(4 * tile_count)
+
+	# values already placed rule out the same value in the tile's row, column and subgrid
+	used_units = [0] * len(geometry.units)
+	for index, value in enumerate(values):
+		if value:
+			for unit in geometry.tile_units[index]:
+				used_units[unit] |= 1 << (value - 1)
+
+	for index, value in enumerate(values):
+		r = geometry.tile_rows[index]
+		c = geometry.tile_columns[index]
+		b = geometry.tile_subgrids[index]
+		if value:
+			options = [value]
+		else:
+			used = 0
+			for unit in geometry.tile_units[index]:
+				used |= used_units[unit]
+			options = [v for v in range(1, n + 1) if not used & (1 << (v - 1))]
+		for v in options:
+			matrix.add_row((
+				index,
+				tile_count + r * n + v - 1,
+				2 * tile_count + c * n + v - 1,
+				3 * tile_count + b * n + v - 1), (index, v))
+
+	try:
+		for rows in matrix.solutions(cancel_event):
+			solution = [0] * tile_count
+			for index, v in rows:
+				solution[index] = v
+			yield solution
+	finally:
+		if stats is not None:
+			stats.record_search(matrix.nodes, matrix.max_depth)
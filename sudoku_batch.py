@@ -0,0 +1,150 @@
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+from collections import namedtuple
+
+from sudoku_io import ERROR_KEY, read_puzzles, write_puzzles
+from sudoku_solver import STRATEGY_SETS, SudokuPuzzle
+
+# index is the position of the puzzle in the input, data is the serialised solved puzzle (None if it failed)
+# and error describes why the puzzle could not be solved (None if it succeeded)
+BatchResult = namedtuple("BatchResult", ["index", "data", "error"])
+
+
+def solve_serialised_puzzle(puzzle_options, item):
+	"""
+	Solves a single serialised puzzle. This runs in the worker processes, so any error is caught
+	and returned with the result rather than stopping the rest of the batch.
+
+	:param puzzle_options: The keyword arguments to create each SudokuPuzzle with.
+	:param item: An (index, data) tuple of the puzzle's position in the input and its serialised dict.
+	:return: A BatchResult for the puzzle.
+	"""
+	index, data = item
+	if ERROR_KEY in data:
+		# a record the reader couldn't read
+		return BatchResult(index, None, data[ERROR_KEY])
+	try:
+		puzzle = SudokuPuzzle(**puzzle_options)
+		puzzle.set_from_serialised_dict(data)
+		return BatchResult(index, puzzle.get_as_serialized_dict(), None)
+	except Exception as e:
+		return BatchResult(index, None, f"{type(e).__name__}: {e}")
+
+
+def solve_serialised_chunk(puzzle_options, chunk):
+	"""
+	Solves a chunk of serialised puzzles in a worker process. See solve_serialised_puzzle.
+
+	:param puzzle_options: The keyword arguments to create each SudokuPuzzle with.
+	:param chunk: A list of (index, data) tuples.
+	:return: A list of BatchResults in the same order as the chunk.
+	"""
+	return [solve_serialised_puzzle(puzzle_options, item) for item in chunk]
+
+
+def iter_solve_batch(puzzles, workers=None, chunk_size=64, max_pending_chunks=None, **puzzle_options):
+	"""
+	Solves serialised puzzles from any iterable across a pool of processes, yielding each result as soon as
+	it and every result before it are ready.
+	Puzzles are only read from the iterable while fewer than max_pending_chunks chunks are being solved,
+	so memory use stays constant however many puzzles there are.
+
+	:param puzzles: An iterable of serialised puzzle dicts, as used by set_from_serialised_dict.
+	:param workers: The number of worker processes. Defaults to the number of CPUs. With 1 worker the puzzles
+	are solved in this process.
+	:param chunk_size: The number of puzzles sent to a worker at a time.
+	:param max_pending_chunks: The number of chunks which can be waiting or being solved at once.
+	Defaults to twice the number of workers.
+	:param puzzle_options: Keyword arguments to create each SudokuPuzzle with, e.g. solver or search_order.
+	:return: A generator of BatchResults in the same order as the input puzzles.
+	"""
+	workers = workers or os.cpu_count() or 1
+	if workers < 1:
+		raise ValueError(f"Expected at least 1 worker, actual workers: {workers}")
+	if chunk_size < 1:
+		raise ValueError(f"Expected a chunk size of at least 1, actual chunk size: {chunk_size}")
+	items = enumerate(puzzles)
+	chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+
+	if workers == 1:
+		for chunk in chunks:
+			yield from solve_serialised_chunk(puzzle_options, chunk)
+		return
+
+	max_pending_chunks = max_pending_chunks or workers * 2
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+		# chunks are collected in the order they were submitted regardless of which worker finishes first
+		pending = collections.deque()
+		for chunk in chunks:
+			pending.append(executor.submit(solve_serialised_chunk, puzzle_options, chunk))
+			if len(pending) >= max_pending_chunks:
+				yield from pending.popleft().result()
+		while pending:
+			yield from pending.popleft().result()
+
+
+def solve_batch(puzzles, workers=None, chunk_size=None, **puzzle_options):
+	"""
+	Solves a list of serialised puzzles across a pool of processes.
+
+	:param puzzles: A list of serialised puzzle dicts, as used by set_from_serialised_dict.
+	:param workers: The number of worker processes. See iter_solve_batch.
+	:param chunk_size: The number of puzzles sent to a worker at a time. Defaults to spreading the puzzles
+	over roughly four chunks per worker.
+	:param puzzle_options: Keyword arguments to create each SudokuPuzzle with, e.g. solver or search_order.
+	:return: A list of BatchResults in the same order as the input puzzles.
+	"""
+	if chunk_size is None:
+		chunk_size = max(1, len(puzzles) // ((workers or os.cpu_count() or 1) * 4))
+	return list(iter_solve_batch(puzzles, workers=workers, chunk_size=chunk_size, **puzzle_options))
+
+
+def solve_puzzles_file(path, workers=None, chunk_size=None, **puzzle_options):
+	"""
+	Solves every puzzle in a puzzles file, in the {"puzzles": [...]} format of PuzzleExample.json.
+
+	:param path: The path of the puzzles file.
+	:param workers: The number of worker processes. See solve_batch.
+	:param chunk_size: The number of puzzles sent to a worker at a time. See solve_batch.
+	:param puzzle_options: Keyword arguments to create each SudokuPuzzle with.
+	:return: A list of BatchResults in the same order as the puzzles in the file.
+	"""
+	with open(path, "rt") as json_in:
+		puzzles = json.load(json_in)["puzzles"]
+	return solve_batch(puzzles, workers=workers, chunk_size=chunk_size, **puzzle_options)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Solve every puzzle in a puzzles file across multiple processes.")
+	parser.add_argument(
+		"input", help="The puzzles file to solve: .json like PuzzleExample.json, .ndjson/.jsonl, or one puzzle per line.")
+	parser.add_argument("output", help="The file to write the solved puzzles to, in any of the input formats.")
+	parser.add_argument("--workers", type=int, default=None, help="The number of worker processes.")
+	parser.add_argument("--chunk-size", type=int, default=64, help="The number of puzzles sent to a worker at a time.")
+	parser.add_argument("--solver", default="heuristic", help="The solver backend to use.")
+	parser.add_argument(
+		"--strategies", default="fast", choices=STRATEGY_SETS,
+		help="The heuristic solver's strategy set. \"full\" rates every puzzle.")
+	args = parser.parse_args()
+
+	results = iter_solve_batch(
+		read_puzzles(args.input), workers=args.workers, chunk_size=args.chunk_size, solver=args.solver,
+		strategies=args.strategies)
+
+	def report_errors(results):
+		for result in results:
+			if result.error:
+				print(f"Puzzle {result.index} could not be solved: {result.error}", file=sys.stderr)
+			yield result
+
+	# failed puzzles are kept in their place as error records, except in the binary format which has no room
+	# for them and leaves them out, so the report on stderr is the only record of them there
+	write_puzzles(args.output, (result.data or {ERROR_KEY: result.error} for result in report_errors(results)))
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,191 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+
+from sudoku_io import read_puzzles
+from sudoku_solver import SEARCH_ORDERS, SOLVERS, STRATEGY_SETS, SolveStats, SudokuPuzzle
+
+BENCHMARK_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+CORPUS_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, "corpus")
+RESULTS_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, "results")
+# each tier is a file of the same name in the corpus directory, in the line format
+TIERS = ("easy", "hard", "adversarial", "16x16", "25x25")
+
+
+def load_tier(tier, corpus_directory=CORPUS_DIRECTORY):
+	"""
+	:param tier: The name of the tier, one of TIERS.
+	:param corpus_directory: The directory holding the tier files.
+	:return: A list of the serialised puzzles in the tier.
+	"""
+	return list(read_puzzles(os.path.join(corpus_directory, f"{tier}.txt")))
+
+
+def solve_serialised_puzzle(data, puzzle_options, stats_hook=None):
+	puzzle = SudokuPuzzle(stats_hook=stats_hook, **puzzle_options)
+	puzzle.set_from_serialised_dict(data)
+	return puzzle
+
+
+def percentile(sorted_values, fraction):
+	"""
+	:param sorted_values: A non-empty list of values in ascending order.
+	:param fraction: The percentile as a fraction, e.g. 0.99.
+	:return: The nearest-rank percentile of the values.
+	"""
+	rank = max(1, int(-(-fraction * len(sorted_values) // 1)))
+	return sorted_values[rank - 1]
+
+
+def benchmark_tier(puzzles, puzzle_options, repeat=1, measure_memory=True, collect_stats=False):
+	"""
+	Times SudokuPuzzle solving every puzzle in a tier.
+	Memory is measured in a separate pass, since tracing allocations slows the solver down.
+
+	:param puzzles: A list of serialised puzzles.
+	:param puzzle_options: The keyword arguments to create each SudokuPuzzle with.
+	:param repeat: The number of times each puzzle is solved in the timing pass.
+	:param measure_memory: Whether to measure the peak memory of each solve.
+	:param collect_stats: Whether to total the SolveStats of the timing pass, at the small cost of timing each strategy.
+	:return: A dict of the tier's results. Times are in milliseconds and memory in bytes.
+	"""
+	times = []
+	failures = 0
+	peak_memory = None
+	stats = SolveStats() if collect_stats else None
+	for data in puzzles:
+		for _ in range(repeat):
+			start = time.perf_counter()
+			try:
+				solve_serialised_puzzle(data, puzzle_options, stats and stats.merge)
+			except Exception:
+				failures += 1
+			times.append(time.perf_counter() - start)
+
+	if measure_memory:
+		peak_memory = 0
+		tracemalloc.start()
+		try:
+			for data in puzzles:
+				baseline = tracemalloc.get_traced_memory()[0]
+				tracemalloc.reset_peak()
+				try:
+					solve_serialised_puzzle(data, puzzle_options)
+				except Exception:
+					pass
+				peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1] - baseline)
+		finally:
+			tracemalloc.stop()
+
+	times.sort()
+	results = {
+		"puzzles": len(puzzles),
+		"runs": len(times),
+		"failures": failures,
+		"median_ms": statistics.median(times) * 1000,
+		"p99_ms": percentile(times, 0.99) * 1000,
+		"mean_ms": statistics.mean(times) * 1000,
+		"max_ms": times[-1] * 1000,
+		"puzzles_per_second": len(times) / sum(times) if sum(times) else None,
+		"peak_memory_bytes": peak_memory,
+	}
+	if stats is not None:
+		results["stats"] = stats.as_dict()
+	return results
+
+
+def run_benchmarks(
+		tiers=TIERS, repeat=1, measure_memory=True, collect_stats=False, corpus_directory=CORPUS_DIRECTORY,
+		**puzzle_options):
+	"""
+	Benchmarks each tier of the corpus.
+
+	:param tiers: The names of the tiers to run.
+	:param repeat: The number of times each puzzle is solved in the timing pass.
+	:param measure_memory: Whether to measure the peak memory of each solve.
+	:param collect_stats: Whether to total the SolveStats of each tier.
+	:param corpus_directory: The directory holding the tier files.
+	:param puzzle_options: Keyword arguments to create each SudokuPuzzle with, e.g. solver or search_order.
+	:return: A dict of the run's settings and the results of each tier, ready to be saved as JSON.
+	"""
+	results = {
+		"created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"options": dict(puzzle_options, repeat=repeat),
+		"tiers": {},
+	}
+	for tier in tiers:
+		results["tiers"][tier] = benchmark_tier(
+			load_tier(tier, corpus_directory), puzzle_options, repeat=repeat, measure_memory=measure_memory,
+			collect_stats=collect_stats)
+	return results
+
+
+def format_results(results, baseline=None):
+	"""
+	:param results: The results of run_benchmarks.
+	:param baseline: Optionally, the results of an earlier run to compare the medians and p99s against.
+	:return: The results as a table.
+	"""
+	lines = [f"{'tier':<12}{'puzzles':>8}{'failed':>8}{'median ms':>12}{'p99 ms':>12}{'puzzles/s':>12}{'peak KiB':>10}"]
+	for tier, result in results["tiers"].items():
+		peak = "-" if result["peak_memory_bytes"] is None else f"{result['peak_memory_bytes'] / 1024:.0f}"
+		line = (
+			f"{tier:<12}{result['puzzles']:>8}{result['failures']:>8}{result['median_ms']:>12.3f}"
+			f"{result['p99_ms']:>12.3f}{result['puzzles_per_second'] or 0:>12.1f}{peak:>10}")
+		if baseline and tier in baseline["tiers"]:
+			old = baseline["tiers"][tier]
+			line += f"  median x{result['median_ms'] / old['median_ms']:.2f}, p99 x{result['p99_ms'] / old['p99_ms']:.2f}"
+		lines.append(line)
+		if "stats" in result:
+			for name, strategy in result["stats"]["strategies"].items():
+				lines.append(
+					f"    {name:<44}{strategy['calls']:>8} calls{strategy['placed']:>8} placed"
+					f"{strategy.get('eliminated', 0):>8} eliminated{strategy['seconds'] * 1000:>12.1f} ms")
+			lines.append(
+				f"    {'backtracking nodes':<44}{result['stats']['backtracking nodes']:>8}"
+				f"    max depth {result['stats']['max depth']}")
+	return "\n".join(lines)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the solver against the tiered puzzle corpus.")
+	parser.add_argument("--tiers", nargs="+", default=list(TIERS), choices=TIERS, help="The tiers to run.")
+	parser.add_argument("--solver", default="heuristic", choices=SOLVERS, help="The solver backend to use.")
+	parser.add_argument("--search-order", default="mrv", choices=SEARCH_ORDERS, help="The backtracking search order.")
+	parser.add_argument(
+		"--strategies", default="fast", choices=STRATEGY_SETS, help="The heuristic solver's strategy set.")
+	parser.add_argument("--repeat", type=int, default=1, help="The number of times each puzzle is solved.")
+	parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory pass.")
+	parser.add_argument("--stats", action="store_true", help="Report the time, placements and eliminations of each solving strategy.")
+	parser.add_argument("--output", help="The file to write the results to. Defaults to a timestamped file in "
+										 "benchmarks/results.")
+	parser.add_argument("--compare", help="A results file from an earlier run to compare against.")
+	args = parser.parse_args()
+
+	results = run_benchmarks(
+		tiers=args.tiers, repeat=args.repeat, measure_memory=not args.no_memory, collect_stats=args.stats,
+		solver=args.solver, search_order=args.search_order, strategies=args.strategies)
+
+	baseline = None
+	if args.compare:
+		with open(args.compare, "rt") as json_in:
+			baseline = json.load(json_in)
+	print(format_results(results, baseline))
+
+	output = args.output
+	if not output:
+		os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+		output = os.path.join(RESULTS_DIRECTORY, f"{results['created'].replace(':', '')}.json")
+	with open(output, "wt") as json_out:
+		json.dump(results, json_out, indent=4)
+	print(f"Results written to {output}")
+
+
+if __name__ == "__main__": main()
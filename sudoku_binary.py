@@ -0,0 +1,263 @@
+import argparse
+import mmap
+import struct
+import sys
+
+from sudoku_geometry import get_geometry
+from sudoku_solver import DIFFICULTIES
+
+# A binary puzzles file is a header followed by fixed-width records, so record i starts at
+# HEADER.size + i * record_size and can be read without touching the rest of the file.
+# Each record is a flags byte, then the grid and the solved grid with every tile packed into cell_bits bits
+# (4 for 9x9, 5 for 16x16 and 25x25), least significant bits first in row-major order.
+BINARY_EXTENSION = ".sdkb"
+MAGIC = b"SDKB"
+VERSION = 1
+# magic, version, side length, bits per cell, a padding byte, record size in bytes and record count, little endian
+HEADER = struct.Struct("<4sBBBxIQ")
+# set in a record's flags when it has a solved grid
+HAS_SOLUTION = 0x01
+# bits 1 to 3 of the flags hold the difficulty: 0 when the puzzle has not been rated,
+# otherwise its position in DIFFICULTIES plus one
+DIFFICULTY_SHIFT = 1
+DIFFICULTY_MASK = 0x0E
+
+
+def cell_bits(side_length):
+	"""
+	:param side_length: The side length of the puzzles.
+	:return: The number of bits each tile is packed into.
+	"""
+	return side_length.bit_length()
+
+
+def grid_size(side_length):
+	"""
+	:param side_length: The side length of the puzzles.
+	:return: The number of bytes a packed grid takes.
+	"""
+	return (side_length * side_length * cell_bits(side_length) + 7) // 8
+
+
+def record_size(side_length):
+	"""
+	:param side_length: The side length of the puzzles.
+	:return: The number of bytes a record takes: the flags and two packed grids.
+	"""
+	return 1 + 2 * grid_size(side_length)
+
+
+def pack_values(values, side_length):
+	"""
+	:param values: The tile values of a grid in row-major order.
+	:param side_length: The side length of the grid.
+	:return: The packed grid, as bytes.
+	"""
+	bits = cell_bits(side_length)
+	packed = 0
+	for value in reversed(values):
+		packed = packed << bits | value
+	return packed.to_bytes(grid_size(side_length), "little")
+
+
+def unpack_values(data, side_length):
+	"""
+	:param data: A packed grid, as a bytes-like object.
+	:param side_length: The side length of the grid.
+	:return: The tile values of the grid in row-major order, as bytes.
+	"""
+	bits = cell_bits(side_length)
+	mask = (1 << bits) - 1
+	packed = int.from_bytes(data, "little")
+	return bytes(packed >> (i * bits) & mask for i in range(side_length * side_length))
+
+
+def encode_record(data, side_length):
+	"""
+	Converts a serialised puzzle dict into a record.
+
+	:param data: A serialised puzzle dict, as returned by SudokuPuzzle.get_as_serialized_dict.
+	An empty or missing solved grid is stored as no solution.
+	:param side_length: The side length of the file's puzzles.
+	:return: The record, as bytes.
+	"""
+	grid = data["grid"]
+	solved_grid = data.get("solved grid") or []
+	if len(grid) != side_length or solved_grid and len(solved_grid) != side_length:
+		raise ValueError(f"Expected puzzles with a side length of {side_length}, actual side length: {len(grid)}")
+	number_set = get_geometry(side_length).number_set
+	flags = HAS_SOLUTION if solved_grid else 0
+	difficulty = data.get("difficulty")
+	if difficulty is not None:
+		if difficulty not in DIFFICULTIES:
+			raise ValueError(f"{difficulty} is not a valid difficulty. Valid difficulties are: {', '.join(DIFFICULTIES)}")
+		flags |= (DIFFICULTIES.index(difficulty) + 1) << DIFFICULTY_SHIFT
+	values = [x for row in grid for x in row]
+	solved_values = [x for row in solved_grid for x in row] or [0] * len(values)
+	if any(x not in number_set and x != 0 for x in values + solved_values):
+		raise ValueError(f"Expected tile values between 0 and {side_length}.")
+	return bytes((flags,)) + pack_values(values, side_length) + pack_values(solved_values, side_length)
+
+
+def decode_record(record, side_length):
+	"""
+	Converts a record into a serialised puzzle dict. See encode_record.
+
+	:param record: The record, as a bytes-like object.
+	:param side_length: The side length of the file's puzzles.
+	:return: A serialised puzzle dict, with an empty solved grid if the record has no solution.
+	"""
+	flags = record[0]
+	size = grid_size(side_length)
+	difficulty = (flags & DIFFICULTY_MASK) >> DIFFICULTY_SHIFT
+	n = side_length
+	values = unpack_values(record[1:1 + size], n)
+	solved_grid = []
+	if flags & HAS_SOLUTION:
+		solved_values = unpack_values(record[1 + size:1 + 2 * size], n)
+		solved_grid = [list(solved_values[i:i + n]) for i in range(0, n * n, n)]
+	return {
+		"side length": n,
+		"difficulty": DIFFICULTIES[difficulty - 1] if difficulty else None,
+		"grid": [list(values[i:i + n]) for i in range(0, n * n, n)],
+		"solved grid": solved_grid,
+	}
+
+
+def write_binary(path, puzzles, side_length=None):
+	"""
+	Writes puzzles to a binary puzzles file one at a time as they are produced.
+	The record count is written into the header once every puzzle has been written.
+	Error records, which have no grid, can't be stored and are left out, so callers report them themselves.
+
+	:param path: The path of the file to write.
+	:param puzzles: An iterable of serialised puzzle dicts, all of the same side length.
+	:param side_length: The side length of the puzzles. Defaults to that of the first puzzle, or 9 if there are none.
+	:return: The number of puzzles written.
+	"""
+	puzzles = (data for data in puzzles if "grid" in data)
+	first = next(puzzles, None)
+	if side_length is None:
+		side_length = 9 if first is None else len(first["grid"])
+	get_geometry(side_length)
+	count = 0
+	with open(path, "wb") as binary_out:
+		binary_out.write(HEADER.pack(MAGIC, VERSION, side_length, cell_bits(side_length), record_size(side_length), 0))
+		if first is not None:
+			binary_out.write(encode_record(first, side_length))
+			count += 1
+			for data in puzzles:
+				binary_out.write(encode_record(data, side_length))
+				count += 1
+		binary_out.seek(0)
+		binary_out.write(HEADER.pack(
+			MAGIC, VERSION, side_length, cell_bits(side_length), record_size(side_length), count))
+	return count
+
+
+class BinaryPuzzleFile:
+	"""
+	A read-only binary puzzles file, mapped into memory with mmap.
+	Records are found from their index, so reading one puzzle doesn't read any other, and record returns a
+	memoryview of a record's bytes without copying them. Release those views before closing the file.
+	"""
+
+	def __init__(self, path):
+		"""
+		:param path: The path of the binary puzzles file.
+		"""
+		self._file = open(path, "rb")
+		try:
+			self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		except (ValueError, OSError):
+			self._file.close()
+			raise ValueError(f"{path} is not a binary puzzles file.")
+		self._view = memoryview(self._map)
+		try:
+			if len(self._map) < HEADER.size:
+				raise ValueError(f"{path} is not a binary puzzles file.")
+			magic, version, side_length, bits, size, count = HEADER.unpack_from(self._map)
+			if magic != MAGIC:
+				raise ValueError(f"{path} is not a binary puzzles file.")
+			if version != VERSION:
+				raise ValueError(f"{path} is version {version} of the binary format, expected version {VERSION}.")
+			get_geometry(side_length)
+			if bits != cell_bits(side_length) or size != record_size(side_length):
+				raise ValueError(f"{path} has a record layout which doesn't match its side length of {side_length}.")
+			if len(self._map) < HEADER.size + count * size:
+				raise ValueError(f"{path} is shorter than its {count} records.")
+		except ValueError:
+			self.close()
+			raise
+		self.side_length = side_length
+		self.record_size = size
+		self._count = count
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def __len__(self):
+		return self._count
+
+	def __getitem__(self, index):
+		"""
+		:param index: The index of the record. Negative indexes count from the end.
+		:return: The record as a serialised puzzle dict.
+		"""
+		return decode_record(self.record(index), self.side_length)
+
+	def __iter__(self):
+		for index in range(self._count):
+			yield self[index]
+
+	def record(self, index):
+		"""
+		:param index: The index of the record. Negative indexes count from the end.
+		:return: A memoryview of the record's bytes in the mapped file.
+		"""
+		if index < 0:
+			index += self._count
+		if not 0 <= index < self._count:
+			raise IndexError(f"Record {index} is out of range for a file of {self._count} records.")
+		start = HEADER.size + index * self.record_size
+		return self._view[start:start + self.record_size]
+
+	def close(self):
+		"""
+		Unmaps and closes the file.
+
+		:return: None
+		"""
+		self._view.release()
+		self._map.close()
+		self._file.close()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Convert puzzles between the file formats, including the binary format.")
+	parser.add_argument("input", help=f"The puzzles file to read: {BINARY_EXTENSION}, .json, .ndjson/.jsonl, or one puzzle per line.")
+	parser.add_argument(
+		"output", help=f"The file to write: {BINARY_EXTENSION}, .json, .ndjson/.jsonl, or one puzzle per line. "
+		"The line format holds one grid per puzzle: the solved grid, or the grid of puzzles without a solution.")
+	parser.add_argument(
+		"--unsolved", action="store_true", help="Write the unsolved grids to the line format, even for solved puzzles.")
+	args = parser.parse_args()
+
+	# imported here since sudoku_io reads and writes the binary format through this module
+	from sudoku_io import ERROR_KEY, read_puzzles, write_puzzles
+
+	def report_errors(puzzles):
+		for data in puzzles:
+			if ERROR_KEY in data:
+				print(f"A puzzle could not be read: {data[ERROR_KEY]}", file=sys.stderr)
+			yield data
+
+	count = write_puzzles(
+		args.output, report_errors(read_puzzles(args.input)), key="grid" if args.unsolved else "solved grid")
+	print(f"Converted {count} puzzles to {args.output}")
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,344 @@
+import collections
+import dbm
+import itertools
+import math as maths
+import threading
+from collections import namedtuple
+
+from sudoku_geometry import get_geometry
+
+# A symmetry of an n x n puzzle. The grid is transposed first if transposed is set, then row i of the result is
+# row row_order[i] and column j is column column_order[j], and finally every value v is replaced by relabel[v].
+# relabel[0] is always 0, so empty tiles stay empty.
+GridTransform = namedtuple("GridTransform", ["side_length", "transposed", "row_order", "column_order", "relabel"])
+
+# key identifies the puzzle's symmetry class in a SolutionCache, values are the transformed tile values in row-major
+# order and transform maps the puzzle onto them. exact is False when there were too many tied orders to compare,
+# in which case the key is still deterministic but equivalent puzzles may not share it.
+CanonicalForm = namedtuple("CanonicalForm", ["key", "values", "transform", "exact"])
+
+# a cached solution, in canonical form when returned by SolutionCache.get, and the puzzle's difficulty,
+# which every symmetry of the puzzle shares, or None if it was stored unrated
+CachedSolution = namedtuple("CachedSolution", ["solution", "difficulty"])
+
+
+def transform_values(values, transform):
+	"""
+	:param values: The tile values of a puzzle in row-major order.
+	:param transform: The GridTransform to apply.
+	:return: The transformed tile values in row-major order, as bytes.
+	"""
+	n = transform.side_length
+	relabel = transform.relabel
+	if transform.transposed:
+		return bytes(
+			relabel[values[c * n + r]] for r in transform.row_order for c in transform.column_order)
+	return bytes(relabel[values[r * n + c]] for r in transform.row_order for c in transform.column_order)
+
+
+def inverse_transform_values(values, transform):
+	"""
+	Maps tile values produced by transform_values back onto the original grid, e.g. to map a cached solution
+	of a canonical form back to the puzzle it was made from.
+
+	:param values: The transformed tile values in row-major order.
+	:param transform: The GridTransform which produced them.
+	:return: The original tile values in row-major order, as a bytearray.
+	"""
+	n = transform.side_length
+	unlabel = [0] * (n + 1)
+	for value, label in enumerate(transform.relabel):
+		unlabel[label] = value
+	original = bytearray(n * n)
+	for i, r in enumerate(transform.row_order):
+		for j, c in enumerate(transform.column_order):
+			index = c * n + r if transform.transposed else r * n + c
+			original[index] = unlabel[values[i * n + j]]
+	return original
+
+
+def rank(signatures):
+	"""
+	:param signatures: A list of comparable signatures.
+	:return: A list of the rank of each signature among the distinct signatures.
+	"""
+	ranks = {signature: i for i, signature in enumerate(sorted(set(signatures)))}
+	return [ranks[signature] for signature in signatures]
+
+
+def refine_colours(values, side_length):
+	"""
+	Colours the rows, columns, bands (rows of subgrids), stacks (columns of subgrids) and values of a grid so that
+	any symmetry of the grid maps each of them to one of the same colour. Every colour starts the same and is
+	refined by the colours of whatever it meets (a row by the columns and values of its tiles and by its band,
+	and so on) until no colour class splits any further.
+
+	:param values: The tile values of the puzzle in row-major order.
+	:param side_length: The side length of the puzzle.
+	:return: A (row, column, band, stack) tuple of lists of colours.
+	"""
+	n = side_length
+	s = get_geometry(n).sub_side_length
+	tiles = [(index // n, index % n, value) for index, value in enumerate(values) if value]
+	row_colours = [0] * n
+	column_colours = [0] * n
+	band_colours = [0] * s
+	stack_colours = [0] * s
+	value_colours = [0] * (n + 1)
+	class_count = 5
+	while True:
+		row_tiles = [[] for _ in range(n)]
+		column_tiles = [[] for _ in range(n)]
+		value_tiles = [[] for _ in range(n + 1)]
+		for r, c, value in tiles:
+			row_tiles[r].append((column_colours[c], value_colours[value]))
+			column_tiles[c].append((row_colours[r], value_colours[value]))
+			value_tiles[value].append((row_colours[r], column_colours[c]))
+		new_rows = rank([
+			(row_colours[r], band_colours[r // s], tuple(sorted(row_tiles[r]))) for r in range(n)])
+		new_columns = rank([
+			(column_colours[c], stack_colours[c // s], tuple(sorted(column_tiles[c]))) for c in range(n)])
+		new_values = rank([(value_colours[v], tuple(sorted(value_tiles[v]))) for v in range(n + 1)])
+		new_bands = rank([
+			(band_colours[b], tuple(sorted(row_colours[b * s:(b + 1) * s]))) for b in range(s)])
+		new_stacks = rank([
+			(stack_colours[b], tuple(sorted(column_colours[b * s:(b + 1) * s]))) for b in range(s)])
+		# the previous colours are part of every signature, so classes only ever split and this terminates
+		new_class_count = sum(len(set(colours)) for colours in (
+			new_rows, new_columns, new_values, new_bands, new_stacks))
+		row_colours, column_colours, value_colours = new_rows, new_columns, new_values
+		band_colours, stack_colours = new_bands, new_stacks
+		if new_class_count == class_count:
+			return row_colours, column_colours, band_colours, stack_colours
+		class_count = new_class_count
+
+
+def tied_orders(items, colours):
+	"""
+	:param items: The items to order.
+	:param colours: The colour of each item, indexed by item.
+	:return: A (count, orders) tuple of the number of orders of the items sorted by colour, where items of the
+	same colour can be in any order, and an iterator of those orders as lists.
+	"""
+	groups = [list(group) for _, group in itertools.groupby(sorted(items, key=colours.__getitem__), colours.__getitem__)]
+	count = 1
+	for group in groups:
+		count *= maths.factorial(len(group))
+	orders = (
+		list(itertools.chain.from_iterable(permutation))
+		for permutation in itertools.product(*(itertools.permutations(group) for group in groups)))
+	return count, orders
+
+
+def line_orders(line_colours, group_colours, sub_side_length):
+	"""
+	Orders the rows (or columns) of a grid: groups of rows are ordered by colour, then the rows in each group.
+
+	:param line_colours: The colour of each row.
+	:param group_colours: The colour of each band.
+	:param sub_side_length: The number of rows in a band.
+	:return: A (count, orders) tuple as returned by tied_orders.
+	"""
+	s = sub_side_length
+	group_count, group_orders = tied_orders(range(s), group_colours)
+	within = [tied_orders(range(b * s, (b + 1) * s), line_colours) for b in range(s)]
+	count = group_count
+	for within_count, _ in within:
+		count *= within_count
+	# there are at most sub_side_length! orders within each band, so they are listed up front and combined lazily
+	within_orders = [list(orders) for _, orders in within]
+	orders = (
+		list(itertools.chain.from_iterable(lines))
+		for group_order in group_orders
+		for lines in itertools.product(*(within_orders[b] for b in group_order)))
+	return count, orders
+
+
+def relabelled(values, side_length, transposed, row_order, column_order):
+	"""
+	:param values: The tile values of the puzzle in row-major order.
+	:param side_length: The side length of the puzzle.
+	:param transposed: Whether to transpose the grid before reordering it.
+	:param row_order: The rows of the (transposed) grid in their new order.
+	:param column_order: The columns of the (transposed) grid in their new order.
+	:return: A (values, relabel) tuple of the reordered tile values with each value replaced by the order in which
+	it first appears, and the relabel list which does so.
+	"""
+	n = side_length
+	relabel = [0] * (n + 1)
+	next_label = 1
+	result = bytearray(n * n)
+	i = 0
+	for r in row_order:
+		for c in column_order:
+			value = values[c * n + r] if transposed else values[r * n + c]
+			if value:
+				if not relabel[value]:
+					relabel[value] = next_label
+					next_label += 1
+				result[i] = relabel[value]
+			i += 1
+	# values missing from the grid take the remaining labels in ascending order
+	for value in range(1, n + 1):
+		if not relabel[value]:
+			relabel[value] = next_label
+			next_label += 1
+	return bytes(result), relabel
+
+
+def canonical_form(side_length, values, max_candidates=2000):
+	"""
+	Finds the canonical form of a puzzle: the smallest grid, compared in row-major order, that the puzzle can be
+	turned into by relabelling values, reordering rows within bands, reordering bands, doing the same to columns
+	and stacks, and transposing. Every puzzle with the same canonical form is a symmetry of the others, so they
+	can share one solution.
+	Rather than trying every symmetry, rows and columns are sorted by colours that every symmetry preserves
+	(see refine_colours) and only the orders of rows and columns which are tied on colour are compared.
+
+	:param side_length: The side length of the puzzle.
+	:param values: The tile values of the puzzle in row-major order. Empty tiles are 0.
+	:param max_candidates: The number of tied orders to compare in each orientation. When there are more,
+	the first order is used and the form is not exact.
+	:return: The CanonicalForm of the puzzle.
+	"""
+	n = side_length
+	s = get_geometry(n).sub_side_length
+	transposed_values = bytes(values[c * n + r] for r in range(n) for c in range(n))
+	best = None
+	exact = True
+	for transposed in (False, True):
+		row_colours, column_colours, band_colours, stack_colours = refine_colours(
+			transposed_values if transposed else values, n)
+		row_count, row_orders = line_orders(row_colours, band_colours, s)
+		column_count, column_orders = line_orders(column_colours, stack_colours, s)
+		if row_count * column_count > max_candidates:
+			exact = False
+			row_orders = [next(row_orders)]
+			column_orders = [next(column_orders)]
+		else:
+			column_orders = list(column_orders)
+		for row_order in row_orders:
+			for column_order in column_orders:
+				candidate, relabel = relabelled(values, n, transposed, row_order, column_order)
+				if best is None or candidate < best[0]:
+					best = (candidate, GridTransform(n, transposed, tuple(row_order), tuple(column_order), tuple(relabel)))
+	candidate, transform = best
+	return CanonicalForm(bytes([n]) + candidate, candidate, transform, exact)
+
+
+def canonicalise(grid, max_candidates=2000):
+	"""
+	Finds the canonical form of a grid, in the list of rows format accepted by SudokuPuzzle.
+
+	:param grid: The puzzle grid as a list of rows. Empty tiles are 0.
+	:param max_candidates: See canonical_form.
+	:return: The CanonicalForm of the grid.
+	"""
+	return canonical_form(len(grid), bytes(x for row in grid for x in row), max_candidates)
+
+
+class SolutionCache:
+	"""
+	A bounded cache of solutions keyed by canonical form, evicting the least recently used.
+	Solutions are stored in canonical form, so a puzzle which is a symmetry of one already solved
+	gets its solution by mapping the stored one back through its own transform.
+	When a path is given, every solution is also written to a dbm file there and looked up on a miss,
+	so the cache outlives the process. The file is not bounded and should only be opened by one process at a time.
+	Each entry is the solution's tile values followed by the name of the puzzle's difficulty, which is left out
+	when it is unrated, so files written before difficulties were stored still read as unrated entries.
+	"""
+
+	def __init__(self, maxsize=1024, path=None):
+		"""
+		:param maxsize: The number of solutions held in memory.
+		:param path: The path of the file to back the cache with, or None to only cache in memory.
+		"""
+		if maxsize < 1:
+			raise ValueError(f"Expected a cache size of at least 1, actual size: {maxsize}")
+		self.maxsize = maxsize
+		self.path = path
+		self.hits = 0
+		self.misses = 0
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+		self._file = dbm.open(path, "c") if path else None
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		with self._lock:
+			if self._file is not None:
+				self._file.close()
+				self._file = None
+
+	def __remember(self, key, solution):
+		self._entries[key] = solution
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.maxsize:
+			self._entries.popitem(last=False)
+
+	def get(self, key):
+		"""
+		:param key: The key of a CanonicalForm.
+		:return: The CachedSolution of the canonical form with the solution as bytes, or None if it is not cached.
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				self._entries.move_to_end(key)
+			elif self._file is not None:
+				entry = self._file.get(key)
+				if entry is not None:
+					entry = bytes(entry)
+					self.__remember(key, entry)
+			if entry is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+		tile_count = key[0] * key[0]
+		return CachedSolution(entry[:tile_count], entry[tile_count:].decode("ascii") or None)
+
+	def put(self, key, solution, difficulty=None):
+		"""
+		:param key: The key of a CanonicalForm.
+		:param solution: The solution of the canonical form, i.e. the puzzle's solution put through transform_values.
+		:param difficulty: The puzzle's difficulty, or None if it has not been rated.
+		:return: None
+		"""
+		entry = bytes(solution) + (difficulty or "").encode("ascii")
+		with self._lock:
+			self.__remember(key, entry)
+			if self._file is not None:
+				self._file[key] = entry
+
+	def lookup(self, side_length, values):
+		"""
+		Looks up the solution of a puzzle.
+
+		:param side_length: The side length of the puzzle.
+		:param values: The tile values of the puzzle in row-major order.
+		:return: A (cached, form) tuple of the puzzle's CachedSolution with the solution as a bytearray in
+		row-major order, or None if it is not cached, and the puzzle's CanonicalForm to store the solution under
+		with store.
+		"""
+		form = canonical_form(side_length, values)
+		cached = self.get(form.key)
+		if cached is not None:
+			cached = cached._replace(solution=inverse_transform_values(cached.solution, form.transform))
+		return cached, form
+
+	def store(self, form, solution, difficulty=None):
+		"""
+		:param form: The CanonicalForm returned by lookup.
+		:param solution: The puzzle's solution in row-major order.
+		:param difficulty: The puzzle's difficulty, or None if it has not been rated.
+		:return: None
+		"""
+		self.put(form.key, transform_values(solution, form.transform), difficulty)
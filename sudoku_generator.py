@@ -0,0 +1,296 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import random
+import time
+
+from sudoku_cache import GridTransform, transform_values
+from sudoku_geometry import get_geometry
+from sudoku_io import write_puzzles
+from sudoku_solver import DIFFICULTIES, CandidateGrid, SudokuPuzzle
+
+# checking whether a tile can be emptied has a long tail on large grids with few clues, where one check can take
+# minutes, so past this many search nodes the tile is kept as a clue. The puzzle is still unique, just less minimal
+MAX_CHECK_NODES = 2000
+
+
+def random_transform(side_length, rng):
+	"""
+	:param side_length: The side length of the puzzle.
+	:param rng: The random.Random to draw from.
+	:return: A random GridTransform, which turns a puzzle into an equivalent one with the same solution count
+	and difficulty.
+	"""
+	s = get_geometry(side_length).sub_side_length
+
+	def line_order():
+		groups = list(range(s))
+		rng.shuffle(groups)
+		order = []
+		for group in groups:
+			lines = list(range(group * s, (group + 1) * s))
+			rng.shuffle(lines)
+			order += lines
+		return tuple(order)
+
+	labels = list(range(1, side_length + 1))
+	rng.shuffle(labels)
+	return GridTransform(side_length, rng.random() < 0.5, line_order(), line_order(), (0, *labels))
+
+
+def random_solution(side_length, rng):
+	"""
+	Fills a random complete grid: a random first row is completed by the backtracking search
+	and the result is put through a random symmetry.
+
+	:param side_length: The side length of the puzzle.
+	:param rng: The random.Random to draw from.
+	:return: The tile values of the grid in row-major order, as bytes.
+	"""
+	values = [0] * (side_length * side_length)
+	values[:side_length] = rng.sample(range(1, side_length + 1), side_length)
+	candidate_grid = CandidateGrid(side_length, values)
+	candidate_grid.search("mrv")
+	return transform_values(candidate_grid.values, random_transform(side_length, rng))
+
+
+class NodeBudget:
+	"""
+	Stands in for a CandidateGrid's cancel event to stop its search after a number of nodes.
+	"""
+
+	def __init__(self, max_nodes):
+		# the search checks its cancel event once every 256 nodes
+		self.checks_left = max_nodes >> 8
+		self.exhausted = False
+
+	def is_set(self):
+		self.checks_left -= 1
+		self.exhausted = self.checks_left < 0
+		return self.exhausted
+
+
+def has_other_solution(side_length, values, index, value, max_nodes=None):
+	"""
+	Checks whether a puzzle with a known solution has another one where a tile holds a different value.
+	This is all a uniqueness check needs when the tile has just been emptied, and it stops at the first
+	solution found rather than counting them.
+
+	:param side_length: The side length of the puzzle.
+	:param values: The tile values of the puzzle in row-major order, with the tile empty.
+	:param index: The index of the emptied tile.
+	:param value: The value of the tile in the known solution.
+	:param max_nodes: The number of search nodes to give up after, or None to search as long as it takes.
+	:return: True if there is a solution with a different value in the tile, or the search gave up before
+	ruling one out. False otherwise.
+	"""
+	geometry = get_geometry(side_length)
+	bit = 1 << (value - 1)
+	used = 0
+	for peer in geometry.peers[index]:
+		if values[peer]:
+			used |= 1 << (values[peer] - 1)
+	# the tile's peers leave only its own value, which is by far the most common case while there are many clues
+	others = geometry.full_mask & ~used & ~bit
+	if not others:
+		return False
+	budget = None if max_nodes is None else NodeBudget(max_nodes)
+	candidate_grid = CandidateGrid(side_length, values, budget)
+	candidate_grid.candidates[index] = others
+	if not others & (others - 1):
+		candidate_grid.singles.append(index)
+	return candidate_grid.search("mrv") or (budget is not None and budget.exhausted)
+
+
+def remove_clues(side_length, solution, rng, min_clues=0, max_nodes=MAX_CHECK_NODES):
+	"""
+	Empties the tiles of a complete grid in a random order, keeping each tile empty only if the puzzle
+	still has a single solution.
+
+	:param side_length: The side length of the puzzle.
+	:param solution: The tile values of the complete grid in row-major order.
+	:param rng: The random.Random to draw from.
+	:param min_clues: The number of clues to stop at.
+	:param max_nodes: The number of search nodes to spend on checking each tile before keeping it as a clue,
+	or None to always check fully.
+	:return: The tile values of the puzzle in row-major order, as a bytearray.
+	"""
+	values = bytearray(solution)
+	clues = len(values)
+	order = list(range(len(values)))
+	rng.shuffle(order)
+	for index in order:
+		if clues <= min_clues:
+			break
+		value = values[index]
+		values[index] = 0
+		if has_other_solution(side_length, values, index, value, max_nodes):
+			values[index] = value
+		else:
+			clues -= 1
+	return values
+
+
+def rate(side_length, values):
+	"""
+	:param side_length: The side length of the puzzle.
+	:param values: The tile values of the puzzle in row-major order.
+	:return: The difficulty of the puzzle, one of DIFFICULTIES.
+	"""
+	# the fast strategy set leaves small puzzles which need the search unrated
+	puzzle = SudokuPuzzle(lazy=True, strategies="full")
+	puzzle.set_from_serialised_dict({"grid": to_grid(side_length, values)})
+	puzzle.solve()
+	return puzzle.difficulty
+
+
+def to_grid(side_length, values):
+	return [list(values[i:i + side_length]) for i in range(0, side_length * side_length, side_length)]
+
+
+def generate_puzzle(side_length=9, rng=None, min_clues=0):
+	"""
+	Generates a rated puzzle with a unique solution.
+
+	:param side_length: The side length of the puzzle.
+	:param rng: The random.Random to draw from. Defaults to a new unseeded one.
+	:param min_clues: The number of clues to stop removing clues at.
+	:return: The puzzle as a serialised dict, as returned by SudokuPuzzle.get_as_serialized_dict.
+	"""
+	rng = rng or random.Random()
+	solution = random_solution(side_length, rng)
+	values = remove_clues(side_length, solution, rng, min_clues)
+	return {
+		"side length": side_length,
+		"difficulty": rate(side_length, values),
+		"grid": to_grid(side_length, values),
+		"solved grid": to_grid(side_length, solution),
+	}
+
+
+def generate_puzzles(side_length, seed, count, variants=1, difficulty=None, min_clues=0):
+	"""
+	Generates puzzles in a worker process. See iter_generate.
+
+	:param side_length: The side length of the puzzles.
+	:param seed: The seed of the puzzles' random.Random, or None.
+	:param count: The number of puzzles to generate.
+	:param variants: The number of puzzles made from each generated one, the rest being isomorphic duplicates of it.
+	See iter_generate.
+	:param difficulty: Only keep puzzles of this difficulty, or None to keep every puzzle.
+	:param min_clues: The number of clues to stop removing clues at.
+	:return: A list of serialised puzzle dicts.
+	"""
+	rng = random.Random(seed)
+	puzzles = []
+	while len(puzzles) < count:
+		data = generate_puzzle(side_length, rng, min_clues)
+		if difficulty is not None and data["difficulty"] != difficulty:
+			continue
+		puzzles.append(data)
+		grid = bytes(x for row in data["grid"] for x in row)
+		solution = bytes(x for row in data["solved grid"] for x in row)
+		for _ in range(min(variants, count - len(puzzles) + 1) - 1):
+			transform = random_transform(side_length, rng)
+			variant = dict(data)
+			variant["grid"] = to_grid(side_length, transform_values(grid, transform))
+			variant["solved grid"] = to_grid(side_length, transform_values(solution, transform))
+			puzzles.append(variant)
+	return puzzles
+
+
+def count_distinct(count, variants=1, chunk_size=16):
+	"""
+	:param count: The number of puzzles generated.
+	:param variants: The number of puzzles made from each generated one.
+	:param chunk_size: The number of puzzles a worker generates at a time.
+	:return: The number of distinct puzzles among them, i.e. those which are not a variant of another.
+	"""
+	# each chunk starts from a new puzzle, so its last puzzle may have fewer variants
+	return sum(-(-min(chunk_size, count - start) // variants) for start in range(0, count, chunk_size))
+
+
+def iter_generate(
+		count, side_length=9, workers=None, seed=None, variants=1, difficulty=None, min_clues=0, chunk_size=16):
+	"""
+	Generates puzzles across a pool of processes, yielding them as the chunks are finished in order.
+	The same seed, chunk size and variants give the same puzzles however many workers there are.
+
+	:param count: The number of puzzles to generate.
+	:param side_length: The side length of the puzzles.
+	:param workers: The number of worker processes. Defaults to the number of CPUs. With 1 worker the puzzles
+	are generated in this process.
+	:param seed: The seed to generate from, or None for different puzzles every time.
+	:param variants: The number of puzzles made from each generated one, the first as it is and the rest put
+	through random symmetries (relabelling values, reordering rows, columns, bands and stacks, and transposing).
+	The variants look different and have the same difficulty, but they are isomorphic duplicates: they share
+	the generated puzzle's canonical form (see sudoku_cache), so deduplicating by it leaves only the distinct
+	puzzles, of which there are count_distinct(count, variants, chunk_size).
+	:param difficulty: Only generate puzzles of this difficulty, one of DIFFICULTIES, or None for any difficulty.
+	:param min_clues: The number of clues to stop removing clues at.
+	:param chunk_size: The number of puzzles a worker generates at a time.
+	:return: A generator of serialised puzzle dicts.
+	"""
+	workers = workers or os.cpu_count() or 1
+	if workers < 1:
+		raise ValueError(f"Expected at least 1 worker, actual workers: {workers}")
+	if variants < 1:
+		raise ValueError(f"Expected at least 1 variant, actual variants: {variants}")
+	if difficulty is not None and difficulty not in DIFFICULTIES:
+		raise ValueError(f"{difficulty} is not a valid difficulty. Valid difficulties are: {', '.join(DIFFICULTIES)}")
+	base_seed = random.randrange(1 << 32) if seed is None else seed
+	chunks = (
+		(side_length, base_seed * 1000003 + i, min(chunk_size, count - start), variants, difficulty, min_clues)
+		for i, start in enumerate(range(0, count, chunk_size)))
+
+	if workers == 1:
+		for chunk in chunks:
+			yield from generate_puzzles(*chunk)
+		return
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+		pending = collections.deque()
+		for chunk in chunks:
+			pending.append(executor.submit(generate_puzzles, *chunk))
+			if len(pending) >= workers * 2:
+				yield from pending.popleft().result()
+		while pending:
+			yield from pending.popleft().result()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Generate rated puzzles with unique solutions.")
+	parser.add_argument("count", type=int, help="The number of puzzles to generate.")
+	parser.add_argument("output", help="The file to write the puzzles to: .sdkb, .json, .ndjson/.jsonl, or one puzzle per line.")
+	parser.add_argument("--side-length", type=int, default=9, help="The side length of the puzzles.")
+	parser.add_argument("--workers", type=int, default=None, help="The number of worker processes.")
+	parser.add_argument("--seed", type=int, default=None, help="The seed to generate from.")
+	parser.add_argument(
+		"--variants", type=int, default=1,
+		help="The number of puzzles made from each generated one. The extra ones are isomorphic duplicates.")
+	parser.add_argument("--difficulty", choices=DIFFICULTIES, default=None, help="Only generate this difficulty.")
+	parser.add_argument("--min-clues", type=int, default=0, help="The number of clues to stop removing clues at.")
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	difficulties = collections.Counter()
+
+	def counted(puzzles):
+		for data in puzzles:
+			difficulties[data["difficulty"]] += 1
+			yield data
+
+	write_puzzles(args.output, counted(iter_generate(
+		args.count, args.side_length, workers=args.workers, seed=args.seed, variants=args.variants,
+		difficulty=args.difficulty, min_clues=args.min_clues)), key="grid")
+	elapsed = time.perf_counter() - start
+	# the rate counts distinct puzzles, since variants are symmetries of them rather than new puzzles
+	distinct = count_distinct(args.count, args.variants)
+	print(
+		f"Generated {args.count} puzzles, {distinct} of them distinct, in {elapsed:.1f} seconds "
+		f"({distinct / elapsed:.1f} distinct puzzles a second): "
+		+ ", ".join(f"{difficulties[d]} {d}" for d in DIFFICULTIES if difficulties[d]))
+
+
+if __name__ == "__main__": main()
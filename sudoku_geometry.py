@@ -0,0 +1,70 @@
+import functools
+import math as maths
+from collections import namedtuple
+
+# The layout of a puzzle of a given side length, shared by every puzzle and solver of that size.
+# Tiles are indexed by row * side_length + column. Units are the rows, then the columns, then the subgrids
+# (numbered left to right, top to bottom), each as a tuple of tile indexes. Every field is immutable so the
+# geometry can't be changed by the puzzles sharing it.
+SudokuGeometry = namedtuple("SudokuGeometry", [
+	"side_length",
+	"sub_side_length",
+	"number_set",  # the values which can be placed in a tile
+	"full_mask",  # the bitmask with a bit set for every value in the number set
+	"tile_rows",  # the row of each tile
+	"tile_columns",  # the column of each tile
+	"tile_subgrids",  # the subgrid number of each tile
+	"subgrid_origins",  # the (row, column) of the top left tile of each subgrid
+	"units",  # the tile indexes of each row, column and subgrid
+	"tile_units",  # the (row, column, subgrid) unit numbers of each tile
+	"peers",  # the tiles which share a row, column or subgrid with each tile
+])
+
+
+@functools.lru_cache(maxsize=None)
+def get_geometry(side_length):
+	"""
+	Returns the geometry for a side length, building it the first time that side length is used.
+
+	:param side_length: The side length of the puzzle, which must be a square number.
+	:return: The SudokuGeometry for the side length.
+	"""
+	sub_side_length = int(maths.sqrt(side_length) + 0.5)
+	if sub_side_length ** 2 != side_length:
+		raise ValueError(f"Expected side length to be square. Actual side length {side_length}.")
+	n = side_length
+	s = sub_side_length
+	tile_count = n * n
+
+	tile_rows = tuple(index // n for index in range(tile_count))
+	tile_columns = tuple(index % n for index in range(tile_count))
+	tile_subgrids = tuple((tile_rows[index] // s) * s + tile_columns[index] // s for index in range(tile_count))
+	subgrid_origins = tuple((sub_row, sub_col) for sub_row in range(0, n, s) for sub_col in range(0, n, s))
+
+	units = [tuple(r * n + c for c in range(n)) for r in range(n)]
+	units += [tuple(r * n + c for r in range(n)) for c in range(n)]
+	units += [tuple((sub_row + i) * n + sub_col + j for i in range(s) for j in range(s))
+			  for sub_row, sub_col in subgrid_origins]
+	tile_units = tuple(
+		(tile_rows[index], n + tile_columns[index], 2 * n + tile_subgrids[index]) for index in range(tile_count))
+
+	peers = []
+	for index in range(tile_count):
+		tile_peers = set()
+		for unit in tile_units[index]:
+			tile_peers.update(units[unit])
+		tile_peers.discard(index)
+		peers.append(tuple(sorted(tile_peers)))
+
+	return SudokuGeometry(
+		side_length,
+		sub_side_length,
+		frozenset(range(1, n + 1)),
+		(1 << n) - 1,
+		tile_rows,
+		tile_columns,
+		tile_subgrids,
+		subgrid_origins,
+		tuple(units),
+		tile_units,
+		tuple(peers))
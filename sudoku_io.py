@@ -0,0 +1,194 @@
+import json
+import math as maths
+
+from sudoku_binary import BINARY_EXTENSION, BinaryPuzzleFile, write_binary
+
+# values above 9 are written as letters in the line format, so 10 is "A" and 25 is "P"
+LINE_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+# the readers yield a record which can't be read as {ERROR_KEY: description} in its place rather than raising,
+# so one bad line doesn't stop a stream of puzzles, and the writers keep such records in their place too
+ERROR_KEY = "error"
+
+
+def line_to_grid(line):
+	"""
+	Converts a puzzle in the line format into a grid.
+	The line format is one character per tile in row-major order, with "0" or "." for an empty tile,
+	so a 9x9 puzzle is an 81 character line.
+
+	:param line: The puzzle line, without its line ending.
+	:return: The puzzle grid as a list of rows.
+	"""
+	side_length = int(maths.sqrt(len(line)) + 0.5)
+	if side_length * side_length != len(line):
+		raise ValueError(f"Expected a line with a square number of tiles, actual length: {len(line)}")
+	values = []
+	for character in line:
+		if character == ".":
+			values.append(0)
+		else:
+			value = LINE_CHARACTERS.find(character.upper())
+			if value == -1:
+				raise ValueError(f"{character} is not a valid tile in the line format.")
+			values.append(value)
+	return [values[i:i + side_length] for i in range(0, len(values), side_length)]
+
+
+def grid_to_line(grid):
+	"""
+	Converts a grid into the line format. See line_to_grid.
+
+	:param grid: The puzzle grid as a list of rows.
+	:return: The puzzle line, without a line ending.
+	"""
+	return "".join(LINE_CHARACTERS[value] for row in grid for value in row)
+
+
+def read_ndjson(lines):
+	"""
+	Reads serialised puzzles from newline-delimited JSON, one puzzle dict per line.
+
+	:param lines: An iterable of lines, such as an open file.
+	:return: A generator of serialised puzzle dicts, with an error record for each line which isn't a JSON object.
+	"""
+	for number, line in enumerate(lines, 1):
+		line = line.strip()
+		if line:
+			try:
+				data = json.loads(line)
+			except ValueError as e:
+				yield {ERROR_KEY: f"Line {number}: {e}"}
+				continue
+			if isinstance(data, dict):
+				yield data
+			else:
+				yield {ERROR_KEY: f"Line {number}: Expected a JSON object, actual type: {type(data).__name__}"}
+
+
+def write_ndjson(out, puzzles):
+	"""
+	Writes serialised puzzles as newline-delimited JSON, one puzzle at a time as they are produced.
+
+	:param out: A writable text file.
+	:param puzzles: An iterable of serialised puzzle dicts.
+	:return: The number of puzzles written.
+	"""
+	count = 0
+	for puzzle in puzzles:
+		out.write(json.dumps(puzzle, separators=(",", ":")))
+		out.write("\n")
+		count += 1
+	return count
+
+
+def read_lines(lines):
+	"""
+	Reads puzzles in the line format, one puzzle per line. Blank lines and lines starting with "#" are skipped.
+
+	:param lines: An iterable of lines, such as an open file.
+	:return: A generator of serialised puzzle dicts, with an error record for each line which isn't a puzzle.
+	"""
+	for number, line in enumerate(lines, 1):
+		line = line.strip()
+		if line and not line.startswith("#"):
+			try:
+				grid = line_to_grid(line)
+			except ValueError as e:
+				yield {ERROR_KEY: f"Line {number}: {e}"}
+				continue
+			yield {
+				"side length": len(grid),
+				"difficulty": None,
+				"grid": grid,
+				"solved grid": []
+			}
+
+
+def write_lines(out, puzzles, key="solved grid"):
+	"""
+	Writes puzzles in the line format, one puzzle at a time as they are produced.
+	Error records are kept in their place as comments, which read_lines skips.
+
+	:param out: A writable text file.
+	:param puzzles: An iterable of serialised puzzle dicts.
+	:param key: The grid of each puzzle to write, "grid" or "solved grid". Puzzles with an empty solved grid,
+	such as those read from the line format, have their grid written instead.
+	:return: The number of puzzles written.
+	:raises ValueError: If a puzzle has no grid to write.
+	"""
+	count = 0
+	for puzzle in puzzles:
+		if ERROR_KEY in puzzle:
+			out.write(f"# error: {puzzle[ERROR_KEY]}\n")
+			continue
+		grid = puzzle.get(key) or puzzle.get("grid")
+		if not grid:
+			raise ValueError(f"Expected a puzzle with a grid to write, actual keys: {', '.join(puzzle)}")
+		out.write(grid_to_line(grid))
+		out.write("\n")
+		count += 1
+	return count
+
+
+def write_json(out, puzzles):
+	"""
+	Writes serialised puzzles as a {"puzzles": [...]} document like PuzzleExample.json, one puzzle at a time
+	as they are produced.
+
+	:param out: A writable text file.
+	:param puzzles: An iterable of serialised puzzle dicts.
+	:return: The number of puzzles written.
+	"""
+	count = 0
+	out.write('{"puzzles": [')
+	for puzzle in puzzles:
+		if count:
+			out.write(", ")
+		out.write(json.dumps(puzzle))
+		count += 1
+	out.write("]}\n")
+	return count
+
+
+def read_puzzles(path):
+	"""
+	Reads puzzles from a file one at a time, choosing the format from the file extension:
+	newline-delimited JSON for .ndjson and .jsonl, a {"puzzles": [...]} document for .json
+	(which has to be loaded whole), the binary format for .sdkb and the line format for anything else.
+
+	:param path: The path of the puzzles file.
+	:return: A generator of serialised puzzle dicts.
+	"""
+	if path.endswith(BINARY_EXTENSION):
+		with BinaryPuzzleFile(path) as puzzles_in:
+			yield from puzzles_in
+		return
+	with open(path, "rt") as puzzles_in:
+		if path.endswith(NDJSON_EXTENSIONS):
+			yield from read_ndjson(puzzles_in)
+		elif path.endswith(".json"):
+			yield from json.load(puzzles_in)["puzzles"]
+		else:
+			yield from read_lines(puzzles_in)
+
+
+def write_puzzles(path, puzzles, key="solved grid"):
+	"""
+	Writes puzzles to a file one at a time, choosing the format from the file extension:
+	newline-delimited JSON for .ndjson and .jsonl, a {"puzzles": [...]} document for .json,
+	the binary format for .sdkb and the line format for anything else.
+
+	:param path: The path of the file to write.
+	:param puzzles: An iterable of serialised puzzle dicts.
+	:param key: The grid of each puzzle to write in the line format, "grid" or "solved grid".
+	:return: The number of puzzles written.
+	"""
+	if path.endswith(BINARY_EXTENSION):
+		return write_binary(path, puzzles)
+	with open(path, "wt") as puzzles_out:
+		if path.endswith(NDJSON_EXTENSIONS):
+			return write_ndjson(puzzles_out, puzzles)
+		if path.endswith(".json"):
+			return write_json(puzzles_out, puzzles)
+		return write_lines(puzzles_out, puzzles, key=key)
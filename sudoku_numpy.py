@@ -0,0 +1,190 @@
+import math as maths
+
+import numpy as np
+
+from sudoku_solver import CandidateGrid
+
+
+def pack_puzzles(grids):
+	"""
+	Packs puzzles of the same side length into a single array.
+
+	:param grids: An iterable of puzzle grids, each a list of rows. Empty tiles are 0.
+	:return: A uint8 array of shape (N, n, n).
+	"""
+	puzzles = np.array(grids, dtype=np.uint8)
+	if puzzles.ndim != 3 or puzzles.shape[1] != puzzles.shape[2]:
+		raise ValueError(f"Expected puzzles with the same square side length, actual shape: {puzzles.shape}")
+	side_length = puzzles.shape[1]
+	if int(maths.sqrt(side_length) + 0.5) ** 2 != side_length:
+		raise ValueError(f"Expected puzzle side length to be square. Actual side length {side_length}.")
+	if (puzzles > side_length).any():
+		raise ValueError(f"Expected puzzle values to be between 0 and {side_length}.")
+	return puzzles
+
+
+# the number of set bits in every 16 bit value, used to count candidates in each half of a mask
+BIT_COUNTS = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+def count_bits(masks):
+	"""
+	:param masks: A uint32 array of bitmasks.
+	:return: An array of the same shape with the number of set bits in each mask.
+	"""
+	return BIT_COUNTS[masks & 0xFFFF] + BIT_COUNTS[masks >> 16]
+
+
+def value_bits(puzzles):
+	"""
+	:param puzzles: A uint8 array of shape (N, n, n).
+	:return: A uint32 array of shape (N, n, n) where bit (v - 1) is set for a tile holding v, and 0 for empty tiles.
+	"""
+	shifts = puzzles.astype(np.uint32) - 1
+	return np.where(puzzles > 0, np.left_shift(np.uint32(1), shifts, dtype=np.uint32), np.uint32(0))
+
+
+def subgrid_view(array):
+	"""
+	Splits the row and column axes of an (N, n, n) array so the subgrid axes can be reduced over.
+
+	:param array: An array of shape (N, n, n).
+	:return: A view of shape (N, s, s, s, s) indexed by [p, subgrid row, row in subgrid, subgrid column,
+	column in subgrid].
+	"""
+	count, side_length = array.shape[:2]
+	sub_side_length = int(maths.sqrt(side_length) + 0.5)
+	return array.reshape(count, sub_side_length, sub_side_length, sub_side_length, sub_side_length)
+
+
+def expand_subgrids(array):
+	"""
+	:param array: An array of shape (N, s, s) with a value per subgrid.
+	:return: An array of shape (N, n, n) with each tile holding the value of its subgrid.
+	"""
+	sub_side_length = array.shape[1]
+	return np.repeat(np.repeat(array, sub_side_length, axis=1), sub_side_length, axis=2)
+
+
+def unit_masks(bits):
+	"""
+	:param bits: A uint32 array of shape (N, n, n) of the bits of the values placed in each tile.
+	:return: A (rows, columns, subgrids) tuple of the values placed in each unit as bitmasks,
+	with shapes (N, n), (N, n) and (N, s, s).
+	"""
+	rows = np.bitwise_or.reduce(bits, axis=2)
+	columns = np.bitwise_or.reduce(bits, axis=1)
+	subgrids = np.bitwise_or.reduce(np.bitwise_or.reduce(subgrid_view(bits), axis=4), axis=2)
+	return rows, columns, subgrids
+
+
+def candidate_array(puzzles):
+	"""
+	Finds the candidate values of every tile of every puzzle, the values not already
+	in the same row, column or subgrid.
+
+	:param puzzles: A uint8 array of shape (N, n, n).
+	:return: A uint32 array of shape (N, n, n) where bit (v - 1) of [p, r, c] is set if v is a candidate
+	for tile (r, c) of puzzle p. Filled tiles have no candidates.
+	"""
+	full_mask = np.uint32((1 << puzzles.shape[1]) - 1)
+	rows, columns, subgrids = unit_masks(value_bits(puzzles))
+	used = rows[:, :, None] | columns[:, None, :] | expand_subgrids(subgrids)
+	return np.where(puzzles == 0, full_mask & ~used, np.uint32(0))
+
+
+def has_repeated_values(puzzles):
+	"""
+	:param puzzles: A uint8 array of shape (N, n, n).
+	:return: A bool array of shape (N,) which is set where a value is repeated in a row, column or subgrid.
+	"""
+	filled = puzzles > 0
+	rows, columns, subgrids = unit_masks(value_bits(puzzles))
+	# a unit has a repeated value when it has more filled tiles than distinct values
+	repeated = (count_bits(rows) != filled.sum(axis=2)).any(axis=1)
+	repeated |= (count_bits(columns) != filled.sum(axis=1)).any(axis=1)
+	repeated |= (count_bits(subgrids) != subgrid_view(filled).sum(axis=(2, 4))).any(axis=(1, 2))
+	return repeated
+
+
+def propagate_batch(puzzles):
+	"""
+	Applies the deductions of fill_singleton_possibilities (tiles with one candidate) and
+	fill_known_subgrid_values (values with one valid tile in a subgrid) to every puzzle at once,
+	until no puzzle changes. Puzzles stop being worked on as soon as they stop changing.
+
+	:param puzzles: A uint8 array of shape (N, n, n).
+	:return: A (propagated, contradiction) tuple of the filled puzzles and a bool array of shape (N,)
+	which is set for puzzles found to have no solution.
+	"""
+	puzzles = puzzles.copy()
+	count, side_length = puzzles.shape[:2]
+	sub_side_length = int(maths.sqrt(side_length) + 0.5)
+	contradiction = has_repeated_values(puzzles)
+	active = ~contradiction & (puzzles == 0).any(axis=(1, 2))
+	while active.any():
+		indexes = np.flatnonzero(active)
+		batch = puzzles[indexes]
+		candidates = candidate_array(batch)
+		empty = batch == 0
+		stuck = (empty & (candidates == 0)).any(axis=(1, 2))
+
+		# naked singles
+		naked = empty & (candidates != 0) & ((candidates & (candidates - np.uint32(1))) == 0)
+
+		# hidden singles in subgrids, the values which are a candidate of exactly one tile in the subgrid
+		subgrid_tiles = subgrid_view(candidates).transpose(0, 1, 3, 2, 4).reshape(
+			len(indexes), sub_side_length, sub_side_length, side_length)
+		seen_once = np.zeros(subgrid_tiles.shape[:3], dtype=np.uint32)
+		seen_twice = np.zeros_like(seen_once)
+		for tile in range(side_length):
+			seen_twice |= seen_once & subgrid_tiles[..., tile]
+			seen_once |= subgrid_tiles[..., tile]
+		hidden = candidates & expand_subgrids(seen_once & ~seen_twice)
+		# a tile can't be the only place for two values, or be a naked single for a different value
+		stuck |= ((hidden & (hidden - np.uint32(1))) != 0).any(axis=(1, 2))
+		stuck |= (naked & (hidden != 0) & (hidden != candidates)).any(axis=(1, 2))
+
+		placements = np.where(naked, candidates, hidden)
+		changed = (placements != 0).any(axis=(1, 2))
+		# the placements are single bits, so log2 gives the value less one exactly
+		placed_values = np.log2(np.maximum(placements, 1)).astype(np.uint8) + 1
+		batch = np.where(placements != 0, placed_values, batch)
+		# placements made in the same step can conflict with each other when a puzzle has no solution
+		stuck |= has_repeated_values(batch)
+
+		puzzles[indexes] = batch
+		contradiction[indexes[stuck]] = True
+		active[indexes[stuck | ~changed | ~(batch == 0).any(axis=(1, 2))]] = False
+	return puzzles, contradiction
+
+
+def solve_batch(grids, search_order="mrv", batch_size=10000):
+	"""
+	Solves many puzzles of the same side length. Every puzzle is propagated together with vectorised
+	operations, and only the puzzles left unsolved are passed one at a time to the backtracking search.
+
+	:param grids: An iterable of puzzle grids, each a list of rows, or an array of shape (N, n, n).
+	:param search_order: The order the backtracking search branches in, one of SEARCH_ORDERS.
+	:param batch_size: The number of puzzles propagated at once, which bounds the size of the candidate arrays.
+	:return: A (solutions, solved) tuple of a uint8 array of shape (N, n, n) and a bool array of shape (N,)
+	which is set for the puzzles that were solved. Unsolved puzzles have no solution and are left as given.
+	"""
+	puzzles = pack_puzzles(grids)
+	count, side_length = puzzles.shape[:2]
+	solutions = np.empty_like(puzzles)
+	solved = np.zeros(count, dtype=bool)
+	for start in range(0, count, batch_size):
+		batch = puzzles[start:start + batch_size]
+		propagated, contradiction = propagate_batch(batch)
+		batch_solved = ~contradiction & ~(propagated == 0).any(axis=(1, 2))
+		for i in np.flatnonzero(~contradiction & ~batch_solved):
+			candidate_grid = CandidateGrid(side_length, propagated[i].ravel().tolist())
+			if candidate_grid.search(search_order):
+				propagated[i] = np.array(candidate_grid.values, dtype=np.uint8).reshape(side_length, side_length)
+				batch_solved[i] = True
+		# the deductions are sound, so a contradiction means the puzzle has no solution
+		propagated[~batch_solved] = batch[~batch_solved]
+		solutions[start:start + batch_size] = propagated
+		solved[start:start + batch_size] = batch_solved
+	return solutions, solved
@@ -0,0 +1,195 @@
+import argparse
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+from sudoku_io import read_puzzles
+from sudoku_solver import SEARCH_ORDERS, CandidateGrid, SudokuPuzzle
+
+# count is the number of solutions found up to the limit, solution is the first solution found as bytes in
+# row-major order (None when there are none), and subproblems and nodes total the work done by the workers
+ParallelSearchResult = namedtuple("ParallelSearchResult", ["count", "solution", "subproblems", "nodes", "max_depth"])
+
+# the result of searching one subproblem in a worker. children is None when the subproblem was searched in full,
+# otherwise its time slice ran out and children holds the smaller subproblems it was split into instead
+SubproblemResult = namedtuple("SubproblemResult", ["count", "solution", "nodes", "max_depth", "children"])
+
+# the event which cancels every worker's search, set up by init_worker in each worker process
+_cancel_event = None
+
+
+def init_worker(cancel_event):
+	global _cancel_event
+	_cancel_event = cancel_event
+
+
+class SliceEvent:
+	"""
+	Stands in for a CandidateGrid's cancel event in a worker, stopping the search when the shared cancel event
+	is set or the subproblem's time slice runs out.
+	"""
+
+	def __init__(self, cancel_event, deadline):
+		"""
+		:param cancel_event: The shared multiprocessing.Event, or None.
+		:param deadline: The time.perf_counter time the slice runs out at, or None for no limit.
+		"""
+		self.cancel_event = cancel_event
+		self.deadline = deadline
+		self.expired = False
+
+	def is_set(self):
+		if self.cancel_event is not None and self.cancel_event.is_set():
+			return True
+		self.expired = self.deadline is not None and time.perf_counter() > self.deadline
+		return self.expired
+
+
+def split_search(candidate_grid, subproblems, order="mrv"):
+	"""
+	Expands the top levels of a grid's search tree breadth first until there are enough subproblems to share out.
+
+	:param candidate_grid: The CandidateGrid to split, which is left unchanged.
+	:param subproblems: The number of subproblems to stop at. There can be fewer if the tree is small.
+	:param order: The search order, one of SEARCH_ORDERS.
+	:return: A list of the tile values of each subproblem in row-major order, as bytes.
+	"""
+	side_length = candidate_grid.side_length
+	frontier = collections.deque()
+	# subproblems which are already full grids can't be split any further
+	full = []
+	for values in candidate_grid.split(order):
+		(frontier if 0 in values else full).append(values)
+	while frontier and len(frontier) + len(full) < subproblems:
+		for values in CandidateGrid(side_length, frontier.popleft()).split(order):
+			(frontier if 0 in values else full).append(values)
+	return full + list(frontier)
+
+
+def search_subproblem(side_length, values, order, limit, time_slice):
+	"""
+	Searches a subproblem in a worker process, stopping when the limit is reached, the search is cancelled
+	or the time slice runs out.
+	A subproblem which runs out of time is split up so that its parts can go to idle workers, and anything it
+	found is thrown away since its parts will be searched again.
+
+	:param side_length: The side length of the puzzle.
+	:param values: The tile values of the subproblem in row-major order.
+	:param order: The search order, one of SEARCH_ORDERS.
+	:param limit: The number of solutions to stop at.
+	:param time_slice: The number of seconds to search for before splitting, or None to search to the end.
+	:return: A SubproblemResult.
+	"""
+	event = SliceEvent(_cancel_event, None if time_slice is None else time.perf_counter() + time_slice)
+	candidate_grid = CandidateGrid(side_length, values, event)
+	count = 0
+	solution = None
+	for _ in candidate_grid.solutions(order):
+		if solution is None:
+			solution = bytes(candidate_grid.values)
+		count += 1
+		if count >= limit:
+			break
+	if event.expired and count < limit:
+		children = CandidateGrid(side_length, values).split(order)
+		return SubproblemResult(0, None, candidate_grid.nodes, candidate_grid.max_depth, children)
+	return SubproblemResult(count, solution, candidate_grid.nodes, candidate_grid.max_depth, None)
+
+
+def parallel_search(
+		candidate_grid, limit=1, workers=None, order="mrv", subproblems_per_worker=16, time_slice=1.0,
+		cancel_event=None):
+	"""
+	Searches a grid across a pool of processes. The top of the search tree is split into many more subproblems
+	than there are workers, and idle workers take the next one as they finish, so an uneven tree still keeps
+	every worker busy. Subproblems which take longer than their time slice are split again and go back on the
+	queue with twice the slice, which shares out the parts of the tree that turn out to be largest.
+	As soon as the limit is reached the other workers are cancelled.
+	Starting the workers takes a moment, so this only pays off for puzzles which take seconds on one core.
+
+	:param candidate_grid: The CandidateGrid to search, which is left unchanged.
+	:param limit: The number of solutions to stop at. 1 finds a solution, 2 tells whether it is unique.
+	:param workers: The number of worker processes. Defaults to the number of CPUs.
+	:param order: The search order, one of SEARCH_ORDERS.
+	:param subproblems_per_worker: The number of subproblems to split the search into for each worker.
+	:param time_slice: The number of seconds a subproblem is searched for before being split again,
+	or None to never split again.
+	:param cancel_event: A threading.Event which stops the search when it is set, in which case the count
+	is not to be trusted.
+	:return: A ParallelSearchResult. Which solution is found first depends on the timing of the workers.
+	"""
+	workers = workers or os.cpu_count() or 1
+	if workers < 1:
+		raise ValueError(f"Expected at least 1 worker, actual workers: {workers}")
+	if limit < 1:
+		raise ValueError(f"Expected the solution limit to be at least 1, actual limit: {limit}")
+	if order not in SEARCH_ORDERS:
+		raise ValueError(f"{order} is not a valid search order. Valid orders are: {', '.join(SEARCH_ORDERS)}")
+	side_length = candidate_grid.side_length
+	initial = split_search(candidate_grid, workers * subproblems_per_worker, order)
+
+	count = 0
+	solution = None
+	submitted = 0
+	nodes = 0
+	max_depth = 0
+	worker_cancel_event = multiprocessing.Event()
+	executor = concurrent.futures.ProcessPoolExecutor(
+		max_workers=workers, initializer=init_worker, initargs=(worker_cancel_event,))
+	try:
+		# future -> the time slice its subproblem was given
+		pending = {}
+
+		def submit(values, subproblem_time_slice):
+			nonlocal submitted
+			submitted += 1
+			future = executor.submit(search_subproblem, side_length, values, order, limit, subproblem_time_slice)
+			pending[future] = subproblem_time_slice
+
+		for values in initial:
+			submit(values, time_slice)
+		while pending and count < limit:
+			if cancel_event is not None and cancel_event.is_set():
+				break
+			done, _ = concurrent.futures.wait(pending, timeout=0.1, return_when=concurrent.futures.FIRST_COMPLETED)
+			for future in done:
+				subproblem_time_slice = pending.pop(future)
+				result = future.result()
+				nodes += result.nodes
+				max_depth = max(max_depth, result.max_depth)
+				if result.children is not None:
+					for values in result.children:
+						submit(values, subproblem_time_slice * 2)
+					continue
+				count += result.count
+				if solution is None:
+					solution = result.solution
+	finally:
+		# the running searches see the event within a few hundred nodes, and the queued ones never start
+		worker_cancel_event.set()
+		executor.shutdown(wait=True, cancel_futures=True)
+	return ParallelSearchResult(min(count, limit), solution, submitted, nodes, max_depth)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Solve large puzzles one at a time, each across a pool of processes.")
+	parser.add_argument("input", help="The puzzles file: .json like PuzzleExample.json, .ndjson/.jsonl, or one puzzle per line.")
+	parser.add_argument("--workers", type=int, default=None, help="The number of worker processes for each puzzle.")
+	parser.add_argument("--count", action="store_true", help="Check each puzzle's solution is unique rather than solving it.")
+	args = parser.parse_args()
+
+	workers = args.workers or os.cpu_count() or 1
+	for i, data in enumerate(read_puzzles(args.input)):
+		puzzle = SudokuPuzzle(lazy=True, workers=workers)
+		puzzle.set_from_serialised_dict(data)
+		start = time.perf_counter()
+		outcome = puzzle.count_solutions().status if args.count else "solved"
+		if not args.count:
+			puzzle.solve()
+		print(f"Puzzle {i}: {outcome} in {time.perf_counter() - start:.2f} seconds on {workers} workers")
+
+
+if __name__ == "__main__": main()
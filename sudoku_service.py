@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import statistics
+import threading
+import time
+
+from sudoku_benchmark import percentile
+from sudoku_io import read_puzzles
+from sudoku_solver import SEARCH_ORDERS, SOLVERS, SudokuPuzzle
+
+
+class ServiceBusyError(Exception):
+	"""
+	Raised when a request arrives while the service already has as many requests waiting as it allows.
+	"""
+	pass
+
+
+class SolveService:
+	"""
+	Solves puzzles for asyncio code on a pool of worker threads.
+	At most max_workers puzzles are solved at once. Further requests wait for a worker, and once max_waiting
+	requests are waiting new ones are turned away with ServiceBusyError, so a burst of traffic gets backpressure
+	rather than an ever growing queue.
+	A request's timeout covers both its wait and its solve. When it runs out, or the awaiting task is cancelled,
+	the solve's cancel event is set and the search stops at its next checkpoint, freeing the worker.
+	The workers are threads so that they can be cancelled; they share the interpreter, so use sudoku_batch
+	rather than a service when throughput across cores matters more than latency.
+	"""
+
+	def __init__(self, max_workers=4, max_waiting=None, **puzzle_options):
+		"""
+		:param max_workers: The number of puzzles solved at once.
+		:param max_waiting: The number of requests which can wait for a worker, or None for no limit.
+		:param puzzle_options: Keyword arguments to create each SudokuPuzzle with, e.g. solver or cache.
+		"""
+		if max_workers < 1:
+			raise ValueError(f"Expected at least 1 worker, actual workers: {max_workers}")
+		self.max_workers = max_workers
+		self.max_waiting = max_waiting
+		self.puzzle_options = puzzle_options
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix="sudoku-solve")
+		# a semaphore belongs to the event loop it is first used in, so it is created for each event loop the
+		# service is used from, e.g. by each asyncio.run, along with the count of its requests
+		self._loop = None
+		self._slots = None
+		# the number of requests solving or waiting for a worker, counted before they first wait so that
+		# a burst of requests arriving together sees every one before it
+		self._requests = 0
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		"""
+		Stops the worker threads once the solves already running have finished or stopped.
+
+		:return: None
+		"""
+		self._executor.shutdown(wait=True, cancel_futures=True)
+
+	def solve_puzzle(self, grid, cancel_event):
+		"""
+		Solves a puzzle in a worker thread.
+
+		:param grid: The puzzle grid as a list of rows.
+		:param cancel_event: The threading.Event which stops the solve.
+		:return: The solved SudokuPuzzle.
+		"""
+		puzzle = SudokuPuzzle(lazy=True, cancel_event=cancel_event, **self.puzzle_options)
+		puzzle.set_from_serialised_dict({"grid": grid})
+		puzzle.solve()
+		return puzzle
+
+	async def solve(self, grid, timeout=None):
+		"""
+		Solves a puzzle on one of the service's workers.
+
+		:param grid: The puzzle grid as a list of rows. Empty tiles are 0.
+		:param timeout: The number of seconds to wait for the solution, or None to wait as long as it takes.
+		:return: The solved SudokuPuzzle.
+		:raises TimeoutError: If the puzzle was not solved in time. Its solve is cancelled.
+		:raises ServiceBusyError: If too many requests were already waiting for a worker.
+		:raises UnsolvablePuzzleError: If the puzzle has no solution. Invalid grids raise as SudokuPuzzle does.
+		"""
+		loop = asyncio.get_running_loop()
+		deadline = None if timeout is None else loop.time() + timeout
+		if self._loop is not loop:
+			self._loop = loop
+			self._slots = asyncio.Semaphore(self.max_workers)
+			self._requests = 0
+		slots = self._slots
+		if self.max_waiting is not None and self._requests >= self.max_workers + self.max_waiting:
+			raise ServiceBusyError(f"{self._requests - self.max_workers} requests are already waiting for a worker.")
+
+		self._requests += 1
+		try:
+			await asyncio.wait_for(slots.acquire(), timeout)
+		except BaseException:
+			self.__finish(slots)
+			raise
+
+		cancel_event = threading.Event()
+		try:
+			future = loop.run_in_executor(self._executor, self.solve_puzzle, grid, cancel_event)
+		except BaseException:
+			slots.release()
+			self.__finish(slots)
+			raise
+		# the worker is only handed back once the solve has actually stopped, even if the request gave up on it
+		future.add_done_callback(functools.partial(self.__release, slots))
+		try:
+			remaining = None if deadline is None else max(0.0, deadline - loop.time())
+			return await asyncio.wait_for(asyncio.shield(future), remaining)
+		except BaseException:
+			cancel_event.set()
+			raise
+
+	def __finish(self, slots):
+		# requests from an event loop the service has since moved on from are no longer counted
+		if slots is self._slots:
+			self._requests -= 1
+
+	def __release(self, slots, future):
+		slots.release()
+		self.__finish(slots)
+		if not future.cancelled():
+			# the outcome of a request that timed out is never awaited, so retrieve it to keep asyncio quiet
+			future.exception()
+
+
+_default_service = None
+
+
+async def solve_async(grid, timeout=None, service=None):
+	"""
+	Solves a puzzle without blocking the event loop.
+
+	:param grid: The puzzle grid as a list of rows. Empty tiles are 0.
+	:param timeout: The number of seconds to wait for the solution, or None to wait as long as it takes.
+	:param service: The SolveService to solve on. Defaults to a shared service with default options.
+	:return: The solved SudokuPuzzle. See SolveService.solve for the errors raised.
+	"""
+	global _default_service
+	if service is None:
+		if _default_service is None:
+			_default_service = SolveService()
+		service = _default_service
+	return await service.solve(grid, timeout)
+
+
+async def run_client(puzzles, service, concurrency, timeout):
+	"""
+	A stand-in client which sends every puzzle to a service, keeping up to concurrency requests in flight.
+
+	:param puzzles: A list of serialised puzzles.
+	:param service: The SolveService to send the puzzles to.
+	:param concurrency: The number of requests in flight at once.
+	:param timeout: The timeout of each request in seconds.
+	:return: A list of (outcome, seconds) tuples, one per puzzle, where outcome is "solved", "timeout", "busy"
+	or the name of the error raised.
+	"""
+	in_flight = asyncio.Semaphore(concurrency)
+
+	async def request(data):
+		async with in_flight:
+			start = time.perf_counter()
+			try:
+				await service.solve(data["grid"], timeout)
+				outcome = "solved"
+			except TimeoutError:
+				outcome = "timeout"
+			except ServiceBusyError:
+				outcome = "busy"
+			except Exception as e:
+				outcome = type(e).__name__
+			return outcome, time.perf_counter() - start
+
+	return await asyncio.gather(*(request(data) for data in puzzles))
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Send a puzzles file to a solving service from a stand-in client.")
+	parser.add_argument("input", help="The puzzles file: .json like PuzzleExample.json, .ndjson/.jsonl, or one puzzle per line.")
+	parser.add_argument("--workers", type=int, default=4, help="The number of puzzles the service solves at once.")
+	parser.add_argument("--max-waiting", type=int, default=None, help="The number of requests which can wait for a worker.")
+	parser.add_argument("--concurrency", type=int, default=16, help="The number of requests the client has in flight.")
+	parser.add_argument("--timeout", type=float, default=None, help="The timeout of each request in seconds.")
+	parser.add_argument("--solver", default="heuristic", choices=SOLVERS, help="The solver backend to use.")
+	parser.add_argument("--search-order", default="mrv", choices=SEARCH_ORDERS, help="The backtracking search order.")
+	args = parser.parse_args()
+
+	puzzles = list(read_puzzles(args.input))
+
+	async def run():
+		async with SolveService(
+				args.workers, args.max_waiting, solver=args.solver, search_order=args.search_order) as service:
+			return await run_client(puzzles, service, args.concurrency, args.timeout)
+
+	start = time.perf_counter()
+	results = asyncio.run(run())
+	elapsed = time.perf_counter() - start
+	outcomes = {}
+	for outcome, _ in results:
+		outcomes[outcome] = outcomes.get(outcome, 0) + 1
+	latencies = sorted(seconds for _, seconds in results)
+	print(", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())))
+	print(
+		f"latency median {statistics.median(latencies) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+		f"max {latencies[-1] * 1000:.1f} ms, {len(results) / elapsed:.1f} requests/s")
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,215 @@
+from collections import namedtuple
+
+from sudoku_solver import (
+	CandidateGrid, SolveCancelledError, SudokuPuzzle, UnsolvablePuzzleError, count_bits, mask_to_values)
+
+# a suggested placement of value in the tile at row, column. forced is True when the value is the tile's only
+# candidate, and False when it was taken from a solution
+Hint = namedtuple("Hint", ["row", "column", "value", "forced"])
+
+
+class SolveSession:
+	"""
+	A puzzle being filled in one edit at a time, e.g. by a player.
+	Each edit updates the values found in the tile's row, column and subgrid, so candidates are always up to date
+	without looking at the rest of the grid. The session also keeps the last solution it found and how many
+	filled tiles disagree with it: while none do the puzzle is known to be solvable and hints come straight from
+	that solution, so only an edit which leaves the solution behind leads to a new search, and that search starts
+	from the tiles as they are rather than a full solve.
+	"""
+
+	def __init__(self, grid, **puzzle_options):
+		"""
+		:param grid: The puzzle grid as a list of rows. Empty tiles are 0 and the rest are givens, which can't be edited.
+		:param puzzle_options: Keyword arguments to create the SudokuPuzzle which solves the givens with,
+		e.g. cache or cancel_event.
+		:raises UnsolvablePuzzleError: If a given is invalid or repeated. Invalid grids raise as SudokuPuzzle does.
+		"""
+		puzzle_options["lazy"] = True
+		self.puzzle = SudokuPuzzle(**puzzle_options)
+		self.puzzle.set_from_serialised_dict({"grid": grid})
+		self.side_length = self.puzzle.side_length
+		self.geometry = self.puzzle.geometry
+		self._values = bytearray(x for row in grid for x in row)
+		self._givens = bytes(self._values)
+		# the number of times each value appears in each unit, numbered as in the geometry, and a bitmask
+		# of the values which appear in each unit
+		self._counts = [[0] * (self.side_length + 1) for _ in self.geometry.units]
+		self._unit_masks = [0] * len(self.geometry.units)
+		# the number of extra appearances of values repeated within a unit, so 0 when nothing conflicts
+		self._repeats = 0
+		for index, value in enumerate(self._values):
+			if value:
+				self.__add_value(index, value)
+		# the last solution found, as bytes in row-major order, or None before one has been found
+		self._solution = None
+		# the number of filled tiles which disagree with the solution
+		self._mismatches = 0
+		# set when the tiles as they are have no solution. Placing values can't change that, clearing one can
+		self._unsolvable = False
+
+	def __index(self, row, column):
+		if not (0 <= row < self.side_length and 0 <= column < self.side_length):
+			raise ValueError(f"{row}, {column} is not a valid position in a puzzle with side length {self.side_length}")
+		return row * self.side_length + column
+
+	def __add_value(self, index, value):
+		bit = 1 << (value - 1)
+		for unit in self.geometry.tile_units[index]:
+			if self._counts[unit][value]:
+				self._repeats += 1
+			else:
+				self._unit_masks[unit] |= bit
+			self._counts[unit][value] += 1
+
+	def __remove_value(self, index, value):
+		bit = 1 << (value - 1)
+		for unit in self.geometry.tile_units[index]:
+			self._counts[unit][value] -= 1
+			if self._counts[unit][value]:
+				self._repeats -= 1
+			else:
+				self._unit_masks[unit] &= ~bit
+
+	def __set_solution(self, solution):
+		self._solution = bytes(solution)
+		self._mismatches = sum(1 for value, solved in zip(self._values, self._solution) if value and value != solved)
+
+	def place(self, row, column, value):
+		"""
+		Places a value in a tile, replacing any value the tile already holds.
+		The value may conflict with others, in which case the puzzle is no longer solvable until it is cleared.
+
+		:param row: The row of the tile.
+		:param column: The column of the tile.
+		:param value: The value to place.
+		:return: None
+		"""
+		index = self.__index(row, column)
+		if value not in self.geometry.number_set:
+			raise ValueError(
+				f"{value} is not a valid value in this puzzle. Valid values are: {', '.join(str(x) for x in self.geometry.number_set)}")
+		if self._givens[index]:
+			raise ValueError(f"{row}, {column} is a given and can't be changed.")
+		if self._values[index] == value:
+			return
+		if self._values[index]:
+			self.clear(row, column)
+		self._values[index] = value
+		self.__add_value(index, value)
+		if self._solution is not None and self._solution[index] != value:
+			self._mismatches += 1
+
+	def clear(self, row, column):
+		"""
+		Empties a tile.
+
+		:param row: The row of the tile.
+		:param column: The column of the tile.
+		:return: None
+		"""
+		index = self.__index(row, column)
+		if self._givens[index]:
+			raise ValueError(f"{row}, {column} is a given and can't be changed.")
+		value = self._values[index]
+		if not value:
+			return
+		self.__remove_value(index, value)
+		self._values[index] = 0
+		if self._solution is not None and self._solution[index] != value:
+			self._mismatches -= 1
+		self._unsolvable = False
+
+	def get_tile(self, row, column):
+		return self._values[self.__index(row, column)]
+
+	def get_grid(self):
+		"""
+		:return: The tiles as they are, as a list of rows.
+		"""
+		n = self.side_length
+		return [list(self._values[i:i + n]) for i in range(0, n * n, n)]
+
+	def get_candidate_mask(self, row, column):
+		"""
+		Returns the values that could be placed in an empty tile without repeating a value in the same row,
+		column or subgrid, as a bitmask where bit (v - 1) represents the value v.
+
+		:param row: The row of the tile.
+		:param column: The column of the tile.
+		:return: The bitmask of candidate values for the tile, which is 0 for a filled tile.
+		"""
+		return self.__candidate_mask(self.__index(row, column))
+
+	def __candidate_mask(self, index):
+		if self._values[index]:
+			return 0
+		row, column, subgrid = self.geometry.tile_units[index]
+		return self.geometry.full_mask & ~(self._unit_masks[row] | self._unit_masks[column] | self._unit_masks[subgrid])
+
+	def get_candidates(self, row, column):
+		"""
+		:param row: The row of the tile.
+		:param column: The column of the tile.
+		:return: A set of the candidate values for the tile. See get_candidate_mask.
+		"""
+		return set(mask_to_values(self.get_candidate_mask(row, column)))
+
+	def is_complete(self):
+		"""
+		:return: True if every tile is filled and no value is repeated in a row, column or subgrid. False otherwise.
+		"""
+		return not self._repeats and 0 not in self._values
+
+	def is_solvable(self):
+		"""
+		Checks whether the tiles as they are can be completed. The first check solves the givens with the session's
+		SudokuPuzzle, after which a search is only needed when a filled tile disagrees with the last solution found.
+
+		:return: True if the puzzle can still be completed. False otherwise.
+		:raises SolveCancelledError: If the puzzle's cancel event stopped the search.
+		"""
+		if self._repeats or self._unsolvable:
+			return False
+		if self._solution is None:
+			try:
+				self.puzzle.solve()
+			except UnsolvablePuzzleError:
+				self._unsolvable = True
+				return False
+			self.__set_solution(x for row in self.puzzle.get_as_serialized_dict()["solved grid"] for x in row)
+		if not self._mismatches:
+			return True
+		cancel_event = self.puzzle.cancel_event
+		candidate_grid = CandidateGrid(self.side_length, self._values, cancel_event)
+		if candidate_grid.search(self.puzzle.search_order):
+			self.__set_solution(candidate_grid.values)
+			return True
+		if cancel_event is not None and cancel_event.is_set():
+			raise SolveCancelledError("The search was cancelled before it finished.")
+		self._unsolvable = True
+		return False
+
+	def hint(self):
+		"""
+		Suggests a value to place: a tile with a single candidate if there is one, otherwise the solution's value
+		for the empty tile with the fewest candidates.
+
+		:return: A Hint, or None if the puzzle is full or can't be solved.
+		"""
+		if not self.is_solvable():
+			return None
+		best_index = None
+		best_count = self.side_length + 1
+		for index, value in enumerate(self._values):
+			if not value:
+				mask = self.__candidate_mask(index)
+				if not mask & (mask - 1):
+					return Hint(*divmod(index, self.side_length), mask.bit_length(), True)
+				count = count_bits(mask)
+				if count < best_count:
+					best_index = index
+					best_count = count
+		if best_index is None:
+			return None
+		return Hint(*divmod(best_index, self.side_length), self._solution[best_index], False)
@@ -1,19 +1,556 @@
 import json
-import copy
+import itertools
+import logging
+import random
+import time
+from array import array
+from collections import namedtuple
 import math as maths  # because god save the queen
 
+from dancing_links import sudoku_solutions
+from sudoku_geometry import get_geometry
+
+logger = logging.getLogger(__name__)
+
+
+def mask_to_values(mask):
+	"""
+	Converts a candidate bitmask into the values it represents.
+	Bit (v - 1) of the mask is set when the value v is a member.
+
+	:param mask: The bitmask to convert.
+	:return: A list of the values in the mask in ascending order.
+	"""
+	values = []
+	value = 1
+	while mask:
+		if mask & 1:
+			values.append(value)
+		mask >>= 1
+		value += 1
+	return values
+
+
+def count_bits(mask):
+	return bin(mask).count("1")
+
+
+SEARCH_ORDERS = ("first", "mrv")
+# the statuses of a SolutionCount
+NO_SOLUTION = "none"
+UNIQUE_SOLUTION = "unique"
+MULTIPLE_SOLUTIONS = "multiple"
+
+# status is one of the statuses above, count is the number of solutions found up to the limit
+# and solution is the first solution found as a grid, or None when there are no solutions
+SolutionCount = namedtuple("SolutionCount", ["status", "count", "solution"])
+
+
+class UnsolvablePuzzleError(Exception):
+	"""
+	Raised when a puzzle is found to have no solution.
+	"""
+	pass
 
-class SudokuPuzzle:
+
+class SolveCancelledError(Exception):
+	"""
+	Raised when a solve is stopped by its cancel event before it finished.
+	"""
+	pass
+
+
+class StrategyStats:
+	"""
+	The totals for one solving strategy: how many times it ran, how many tiles it filled, how many candidates
+	it eliminated and how long it took.
+	"""
+	__slots__ = ("calls", "placed", "eliminated", "seconds")
 
 	def __init__(self):
+		self.calls = 0
+		self.placed = 0
+		self.eliminated = 0
+		self.seconds = 0.0
+
+
+class SolveStats:
+	"""
+	Counters collected while a puzzle is solved. Nothing is recorded unless a SolveStats is passed to solve
+	or the puzzle was created with collect_stats or a stats_hook, so solving without stats costs nothing extra.
+	"""
+
+	def __init__(self):
+		# strategy name -> StrategyStats, in the order the strategies first ran
+		self.strategies = {}
+		# the number of placements tried by the backtracking search and the deepest level it reached
+		self.backtracking_nodes = 0
+		self.max_depth = 0
+		# the number of passes solve made over the strategies
+		self.passes = 0
+
+	def record_strategy(self, name, placed, seconds, eliminated=0):
+		"""
+		:param name: The name of the strategy.
+		:param placed: The number of tiles the strategy filled.
+		:param seconds: The wall time the strategy took.
+		:param eliminated: The number of candidates the strategy removed from tiles without filling them.
+		:return: None
+		"""
+		strategy = self.strategies.get(name)
+		if strategy is None:
+			strategy = self.strategies[name] = StrategyStats()
+		strategy.calls += 1
+		strategy.placed += placed
+		strategy.eliminated += eliminated
+		strategy.seconds += seconds
+
+	def record_search(self, nodes, max_depth):
+		"""
+		:param nodes: The number of placements tried by a backtracking search.
+		:param max_depth: The deepest level the search reached.
+		:return: None
+		"""
+		self.backtracking_nodes += nodes
+		self.max_depth = max(self.max_depth, max_depth)
+
+	def merge(self, other):
+		"""
+		Adds the counters of another SolveStats to this one, e.g. to total the stats of many puzzles.
+
+		:param other: The SolveStats to add.
+		:return: None
+		"""
+		for name, other_strategy in other.strategies.items():
+			strategy = self.strategies.get(name)
+			if strategy is None:
+				strategy = self.strategies[name] = StrategyStats()
+			strategy.calls += other_strategy.calls
+			strategy.placed += other_strategy.placed
+			strategy.eliminated += other_strategy.eliminated
+			strategy.seconds += other_strategy.seconds
+		self.record_search(other.backtracking_nodes, other.max_depth)
+		self.passes += other.passes
+
+	def as_dict(self):
+		return {
+			"strategies": {
+				name: {
+					"calls": strategy.calls, "placed": strategy.placed, "eliminated": strategy.eliminated,
+					"seconds": strategy.seconds}
+				for name, strategy in self.strategies.items()},
+			"backtracking nodes": self.backtracking_nodes,
+			"max depth": self.max_depth,
+			"passes": self.passes,
+		}
+
+
+# "heuristic" fills known values before backtracking, "dlx" solves the puzzle as an exact cover problem
+SOLVERS = ("heuristic", "dlx")
+
+# a puzzle's difficulty is that of the hardest strategy the heuristic solver needed to fill it, since solve
+# always goes back to the easiest strategy as soon as a harder one places or eliminates a value
+DIFFICULTIES = ("easy", "medium", "hard", "expert")
+# the strategies of the heuristic solver in the order solve tries them, cheapest first, and the difficulty
+# of the puzzles which need each one. The fill strategies place values, the eliminate strategies only remove
+# candidates, and backtracking_solve always fills the rest of the grid
+STRATEGY_DIFFICULTIES = {
+	"fill_known_subgrid_values": "easy",
+	"fill_singleton_possibilities": "easy",
+	"fill_known_row_column_values": "medium",
+	"eliminate_pointing_candidates": "medium",
+	"eliminate_box_line_reductions": "medium",
+	"eliminate_naked_subsets": "hard",
+	"eliminate_hidden_subsets": "hard",
+	"eliminate_fish": "hard",
+	"backtracking_solve": "expert",
+}
+# the largest naked and hidden subsets (quads) and fish (swordfish) the eliminate strategies look for
+MAX_SUBSET_SIZE = 4
+MAX_FISH_SIZE = 3
+# the strategy sets of the heuristic solver. "full" runs every strategy, which rates every puzzle. "fast" skips
+# the eliminate strategies on grids smaller than MIN_ELIMINATION_SIDE_LENGTH, where the backtracking search is
+# cheaper than the logic it would save, and leaves puzzles which reach the search there unrated
+STRATEGY_SETS = ("fast", "full")
+MIN_ELIMINATION_SIDE_LENGTH = 16
+
+
+def get_strategy_names(side_length, strategies="fast"):
+	"""
+	:param side_length: The side length of the puzzle.
+	:param strategies: The strategy set, one of STRATEGY_SETS.
+	:return: A tuple of the names of the strategies the heuristic solver uses for puzzles of the side length,
+	in the order of STRATEGY_DIFFICULTIES.
+	"""
+	if strategies == "full" or side_length >= MIN_ELIMINATION_SIDE_LENGTH:
+		return tuple(STRATEGY_DIFFICULTIES)
+	return tuple(name for name in STRATEGY_DIFFICULTIES if not name.startswith("eliminate_"))
+
+
+class CandidateGrid:
+	"""
+	A flat structure of the candidate values of every tile, used by the backtracking search.
+	Tiles are indexed by row * side_length + column and each candidate set is a bitmask
+	where bit (v - 1) represents the value v.
+	Placing a value removes it from the candidates of the tile's peers and records each removal on a trail,
+	so the search changes a single structure in place and undoes the removals when it backtracks.
+	"""
+
+	def __init__(self, side_length, values, cancel_event=None):
+		"""
+		:param side_length: The side length of the puzzle.
+		:param values: The tile values of the puzzle in row-major order. Empty tiles are 0.
+		:param cancel_event: A threading.Event which stops the search when it is set. The search checks it
+		every few hundred nodes and stops as if there were no more solutions, so check the event after searching.
+		"""
+		self.side_length = side_length
+		self.cancel_event = cancel_event
+		self.geometry = get_geometry(side_length)
+		self.values = list(values)
+		self.full_mask = self.geometry.full_mask
+		self.units = self.geometry.units
+		self.peers = self.geometry.peers
+		self.trail = []
+		# tiles which have been left with a single candidate and have not yet been placed
+		self.singles = []
+		# the number of placements tried by the search and the deepest level it reached, kept for SolveStats
+		self.nodes = 0
+		self.max_depth = 0
+		self.candidates = [0] * len(self.values)
+		# a grid is inconsistent when a value is repeated among peers or an empty tile has no candidates
+		self.consistent = True
+		for index, value in enumerate(self.values):
+			used = 0
+			for peer in self.peers[index]:
+				if self.values[peer]:
+					used |= 1 << (self.values[peer] - 1)
+			if value:
+				self.consistent = self.consistent and not used & (1 << (value - 1))
+			else:
+				self.candidates[index] = self.full_mask & ~used
+				self.consistent = self.consistent and bool(self.candidates[index])
+				if not self.candidates[index] & (self.candidates[index] - 1):
+					self.singles.append(index)
+
+	def assign(self, index, value):
+		"""
+		Places a value in an empty tile and removes it from the candidates of the tile's peers.
+		Only the peers that had the value removed are checked for having no candidates left.
+
+		:param index: The index of the tile.
+		:param value: The value to place.
+		:return: False if a peer was left with no candidates. True otherwise.
+		"""
+		bit = 1 << (value - 1)
+		candidates = self.candidates
+		trail = self.trail
+		# every tile on the trail was empty when it was recorded, so undo can always clear its value
+		trail.append((index, candidates[index]))
+		candidates[index] = 0
+		self.values[index] = value
+		for peer in self.peers[index]:
+			mask = candidates[peer]
+			if mask & bit:
+				trail.append((peer, mask))
+				mask &= ~bit
+				candidates[peer] = mask
+				if not mask & (mask - 1):
+					if not mask:
+						return False
+					self.singles.append(peer)
+		return True
+
+	def undo(self, mark):
+		"""
+		Reverts every change recorded on the trail since it was the given length.
+
+		:param mark: The length of the trail to revert to.
+		:return: None
+		"""
+		candidates = self.candidates
+		values = self.values
+		trail = self.trail
+		while len(trail) > mark:
+			index, mask = trail.pop()
+			candidates[index] = mask
+			values[index] = 0
+		# tiles waiting to be placed as naked singles are no longer singles once their removals are undone
+		del self.singles[:]
+
+	def propagate(self):
+		"""
+		Places naked singles (tiles with one candidate) and hidden singles (values with one valid tile in a unit)
+		until neither places any more values. Every placement is recorded on the trail.
+
+		:return: False if a contradiction was found. True otherwise.
+		"""
+		values = self.values
+		candidates = self.candidates
+		singles = self.singles
+		changed = True
+		while changed:
+			while singles:
+				index = singles.pop()
+				mask = candidates[index]
+				if mask and not self.assign(index, mask.bit_length()):
+					return False
+			changed = False
+			for unit in self.units:
+				seen_once = 0
+				seen_twice = 0
+				placed = 0
+				for index in unit:
+					if values[index]:
+						placed |= 1 << (values[index] - 1)
+					else:
+						seen_twice |= seen_once & candidates[index]
+						seen_once |= candidates[index]
+				if (seen_once | placed) != self.full_mask:
+					return False
+				hidden = seen_once & ~seen_twice
+				if hidden:
+					for index in unit:
+						mask = candidates[index] & hidden
+						if mask:
+							if mask & (mask - 1):
+								return False
+							if not self.assign(index, mask.bit_length()):
+								return False
+							changed = True
+		return True
+
+	def __next_branch(self, order, start):
+		"""
+		Chooses the next set of alternatives for the search to branch on.
+
+		:param order: The search order, "first" or "mrv".
+		:param start: The index of the last tile branched on. Tiles before it are already filled in "first" order.
+		:return: A list of (index, value) placements to try in turn, or None if the grid is full.
+		"""
+		values = self.values
+		candidates = self.candidates
+		if order == "first":
+			try:
+				index = values.index(0, start)
+			except ValueError:
+				return None
+			return [(index, value) for value in mask_to_values(candidates[index])]
+
+		# minimum remaining values: the tile with the fewest candidates
+		best_index = None
+		best_count = self.side_length + 1
+		for index, mask in enumerate(candidates):
+			if mask:
+				count = count_bits(mask)
+				if count < best_count:
+					best_index = index
+					best_count = count
+					if count <= 2:
+						break
+		if best_index is None:
+			return None
+		branch = [(best_index, value) for value in mask_to_values(candidates[best_index])]
+		if best_count <= 2:
+			return branch
+
+		# a value with fewer valid tiles in some unit than the best tile has candidates gives a smaller branch
+		for unit in self.units:
+			placed = 0
+			for index in unit:
+				if values[index]:
+					placed |= 1 << (values[index] - 1)
+			for value in mask_to_values(self.full_mask & ~placed):
+				bit = 1 << (value - 1)
+				positions = [index for index in unit if candidates[index] & bit]
+				if len(positions) < len(branch):
+					branch = [(index, value) for index in positions]
+					if len(branch) <= 2:
+						return branch
+		return branch
+
+	def solutions(self, order="first"):
+		"""
+		Performs a depth first search, yielding each time a solution is found.
+		In "first" order the search branches on the first empty tile in row-major order and tries its candidates
+		in ascending order. In "mrv" order it branches on the tile, or the value within a unit, with the fewest
+		alternatives and propagates singles after every placement.
+		The search is iterative so that large puzzles are not limited by the recursion limit,
+		and it only continues past a solution when the next one is requested.
+
+		:param order: The search order, one of SEARCH_ORDERS.
+		:return: A generator which yields once per solution, while values holds that solution.
+		"""
+		if order not in SEARCH_ORDERS:
+			raise ValueError(f"{order} is not a valid search order. Valid orders are: {', '.join(SEARCH_ORDERS)}")
+		if not self.consistent:
+			return
+		start_mark = len(self.trail)
+		propagating = order == "mrv"
+		if propagating and not self.propagate():
+			self.undo(start_mark)
+			return
+		branch = self.__next_branch(order, 0)
+		if branch is None:
+			yield
+			self.undo(start_mark)
+			return
+		# each frame holds the alternatives being branched on, the next one to try and the trail mark
+		stack = [[branch, 0, len(self.trail)]]
+		self.max_depth = max(self.max_depth, 1)
+		while stack:
+			frame = stack[-1]
+			branch, position, mark = frame
+			self.undo(mark)
+			if position == len(branch):
+				stack.pop()
+				continue
+			frame[1] = position + 1
+			index, value = branch[position]
+			self.nodes += 1
+			if not self.nodes & 0xFF and self.cancel_event is not None and self.cancel_event.is_set():
+				break
+			if not self.assign(index, value):
+				continue
+			if propagating and not self.propagate():
+				continue
+			branch = self.__next_branch(order, index)
+			if branch is None:
+				yield
+				continue
+			stack.append([branch, 0, len(self.trail)])
+			if len(stack) > self.max_depth:
+				self.max_depth = len(stack)
+		self.undo(start_mark)
+
+	def search(self, order="first"):
+		"""
+		Searches for a single solution. See solutions for the search orders.
+
+		:param order: The search order, one of SEARCH_ORDERS.
+		:return: True if a solution was found, in which case values holds it. False otherwise.
+		"""
+		for _ in self.solutions(order):
+			return True
+		return False
+
+	def split(self, order="first"):
+		"""
+		Expands the top of the search tree by one level, making the placements the search would branch on first
+		(and in "mrv" order propagating singles before and after them) without searching any further.
+		The subproblems have no solutions in common and between them have every solution of the grid,
+		so they can be searched independently and their solution counts added up. The grid is left unchanged.
+
+		:param order: The search order, one of SEARCH_ORDERS.
+		:return: A list of the tile values of each subproblem in row-major order, as bytes. A full grid is its own
+		only subproblem, and a grid with a contradiction has none.
+		"""
+		if order not in SEARCH_ORDERS:
+			raise ValueError(f"{order} is not a valid search order. Valid orders are: {', '.join(SEARCH_ORDERS)}")
+		if not self.consistent:
+			return []
+		start_mark = len(self.trail)
+		propagating = order == "mrv"
+		try:
+			if propagating and not self.propagate():
+				return []
+			branch = self.__next_branch(order, 0)
+			if branch is None:
+				return [bytes(self.values)]
+			subproblems = []
+			mark = len(self.trail)
+			for index, value in branch:
+				if self.assign(index, value) and (not propagating or self.propagate()):
+					subproblems.append(bytes(self.values))
+				self.undo(mark)
+			return subproblems
+		finally:
+			self.undo(start_mark)
+
+
+class SudokuPuzzle:
+	# grids are stored flat, one byte per tile indexed by row * side_length + column,
+	# and __slots__ keeps the per-puzzle overhead down when many puzzles are held in memory
+	__slots__ = (
+		"search_order",
+		"solver",
+		"strategies",
+		"side_length",
+		"sub_side_length",
+		"geometry",
+		"difficulty",
+		"number_set",
+		"_masks",
+		"_grid",
+		"_solved_grid",
+		"_filled",
+		"collect_stats",
+		"stats_hook",
+		"stats",
+		"lazy",
+		"_solve_pending",
+		"cache",
+		"cancel_event",
+		"workers",
+	)
+
+	def __init__(
+			self, search_order="mrv", solver="heuristic", collect_stats=False, stats_hook=None, lazy=False, cache=None,
+			cancel_event=None, workers=1, strategies="fast"):
+		"""
+		:param search_order: The order the backtracking search branches in, one of SEARCH_ORDERS.
+		:param solver: The solver backend used by solve, one of SOLVERS.
+		:param collect_stats: Whether every solve records a SolveStats, kept in stats.
+		:param stats_hook: A function called with the SolveStats at the end of every solve, even one that fails.
+		Setting a hook also collects stats.
+		:param lazy: Whether setting a grid only validates and loads it. A lazy puzzle is solved when solve is called
+		or when the solution is first read, through get_tile, get_row, get_column, get_subgrid or get_as_serialized_dict.
+		:param cache: A sudoku_cache.SolutionCache to look solutions up in before solving and to store them in after.
+		It can be shared by many puzzles.
+		:param cancel_event: A threading.Event which, when set from another thread, stops solve and count_solutions
+		with a SolveCancelledError.
+		:param workers: The number of processes the heuristic solver's backtracking search and count_solutions
+		are split across, see sudoku_parallel. Only worth raising for large puzzles which take seconds to solve.
+		:param strategies: The heuristic solver's strategy set, one of STRATEGY_SETS. Use "full" when the difficulty
+		of small puzzles matters, e.g. to rate them.
+		"""
+		if search_order not in SEARCH_ORDERS:
+			raise ValueError(
+				f"{search_order} is not a valid search order. Valid orders are: {', '.join(SEARCH_ORDERS)}")
+		if solver not in SOLVERS:
+			raise ValueError(f"{solver} is not a valid solver. Valid solvers are: {', '.join(SOLVERS)}")
+		if workers < 1:
+			raise ValueError(f"Expected at least 1 worker, actual workers: {workers}")
+		if strategies not in STRATEGY_SETS:
+			raise ValueError(
+				f"{strategies} is not a valid strategy set. Valid strategy sets are: {', '.join(STRATEGY_SETS)}")
+		self.search_order = search_order
+		self.solver = solver
+		self.strategies = strategies
+		self.collect_stats = collect_stats
+		self.stats_hook = stats_hook
+		# the SolveStats of the last solve, when stats are being collected
+		self.stats = None
+		self.lazy = lazy
+		# set when a lazy puzzle has a grid which has not been solved yet
+		self._solve_pending = False
+		self.cache = cache
+		self.cancel_event = cancel_event
+		self.workers = workers
 		self.side_length = 9
 		self.sub_side_length = 3
-		self.difficulty = None  # todo
-		self._grid = []
-		self.__clear_grid()
-		self._solved_grid = copy.deepcopy(self._grid)
+		self.geometry = get_geometry(self.side_length)
+		# rated by solve, see DIFFICULTIES
+		self.difficulty = None
 		# number set should never contain any false equivalent values or this program will fail
-		self.number_set = set(range(1, 10))
+		self.number_set = self.geometry.number_set
+		# bit (v - 1) of a mask is set when the value v has been placed in that unit, numbered as in the geometry
+		# (rows, then columns, then subgrids). The masks are only kept while solving, see solve
+		self._masks = None
+		self._grid = bytearray()
+		self._solved_grid = bytearray()
+		# the number of filled tiles in the solved grid
+		self._filled = 0
+		self.__clear_grid()
 
 	def __set_grid(self, grid):
 		"""
@@ -23,40 +560,65 @@ class SudokuPuzzle:
 		:param grid: The new grid object to apply.
 		:return: None
 		"""
-		print(f"SETTING GRID...", end=" ", flush=True)
 		if not isinstance(grid, list):
-			print(f"FAILED - SEE EXCEPTION")
 			raise TypeError(f"Expected grid to be of type list, actual type: {type(grid)}")
 		if any([len(x) != len(grid) for x in grid]):
-			print(f"FAILED - SEE EXCEPTION")
 			raise TypeError(f"Expected grid length to be equivalent to width.")
 		if len(grid) < 4:
-			print(f"FAILED - SEE EXCEPTION")
 			raise TypeError(
 				f"Grid with side length {len(grid)} is too small to be a valid puzzle. Minimum length is 4x4.")
 		# method for calculating whether the side length is a perfect square adapted from:
 		# https://djangocentral.com/python-program-to-check-if-a-number-is-perfect-square/
 		if not int(maths.sqrt(len(grid)) + 0.5) ** 2 == len(grid):
-			print(f"FAILED - SEE EXCEPTION")
 			raise TypeError(f"Expected grid side length to be square. Actual side length {len(grid)}.")
+		geometry = get_geometry(len(grid))
+		if any(x not in geometry.number_set and x != 0 for row in grid for x in row):
+			raise UnsolvablePuzzleError("The puzzle that is trying to be solved is invalid and will not have a solution.")
 
-		self._grid = grid
-		self._solved_grid = copy.deepcopy(grid)
+		self._grid = bytearray(x for row in grid for x in row)
+		self._solved_grid = bytearray(self._grid)
 		self.side_length = len(grid)
-		self.sub_side_length = int(maths.sqrt(self.side_length) + 0.5)
-		self.number_set = set(range(1, self.side_length + 1))
-		self._set_difficulty()
-		print(f"DONE")
+		self.sub_side_length = geometry.sub_side_length
+		self.geometry = geometry
+		self.number_set = geometry.number_set
+		self.__rebuild_masks()
+		if self.__has_repeated_values():
+			self._masks = None
+			raise UnsolvablePuzzleError("The puzzle that is trying to be solved repeats a value in a row, column or subgrid.")
+		self._set_difficulty(None)
+		logger.info("Set %dx%d grid", self.side_length, self.side_length)
+
+		if self.lazy:
+			self._masks = None
+			self._solve_pending = True
+		else:
+			self.solve()
 
-		print(f"SOLVING PUZZLE...", end=" ", flush=True)
-		self.solve()
-		print(f"DONE")
+	def __ensure_solved(self):
+		"""
+		Solves a lazy puzzle the first time its solution is read.
+		If the solve fails the puzzle is left pending, so the next read raises the same error.
+
+		:return: None
+		"""
+		if self._solve_pending:
+			try:
+				self.solve()
+			except Exception:
+				self._solve_pending = True
+				raise
 
 	def get_row(self, row):
-		return tuple(self._solved_grid[row])
+		self.__ensure_solved()
+		if row >= self.side_length or row < 0:
+			raise ValueError(f"{row} is not a valid row in a puzzle with side length {self.side_length}")
+		return tuple(self._solved_grid[row * self.side_length:(row + 1) * self.side_length])
 
 	def get_column(self, column):
-		return tuple(x[column] for x in self._solved_grid)
+		self.__ensure_solved()
+		if column >= self.side_length or column < 0:
+			raise ValueError(f"{column} is not a valid column in a puzzle with side length {self.side_length}")
+		return tuple(self._solved_grid[column::self.side_length])
 
 	def get_subgrid(self, row, column):
 		"""
@@ -66,22 +628,21 @@ class SudokuPuzzle:
 		:param column: The column inside the subgrid.
 		:return: A tuple representing the subgrid that the given row/column is in.
 		"""
-		# need to check that the subside length definitely divides the side length equally
-		# (its okay for now doing "classic" sudoku puzzles)
-		row_offset = (row // self.sub_side_length) * self.sub_side_length
-		column_offset = (column // self.sub_side_length) * self.sub_side_length
-		if row_offset >= self.side_length or column_offset >= self.side_length:
+		self.__ensure_solved()
+		if row >= self.side_length or column >= self.side_length or row < 0 or column < 0:
 			raise ValueError(
 				f"{row}, {column} is not a valid subgrid position in a puzzle with side length {self.side_length} and sub side length {self.sub_side_length}")
-		subgrid = [0] * (self.side_length // self.sub_side_length)
-		for i in range(len(subgrid)):
-			subgrid[i] = self.get_row(row_offset + i)[column_offset:column_offset + self.sub_side_length]
-		return tuple(subgrid)
+		row_offset, column_offset = self.geometry.subgrid_origins[self.__get_subgrid_index(row, column)]
+		start = row_offset * self.side_length + column_offset
+		return tuple(
+			tuple(self._solved_grid[start + i * self.side_length:start + i * self.side_length + self.sub_side_length])
+			for i in range(self.sub_side_length))
 
 	def get_tile(self, row, column):
-		if row >= self.side_length or column >= self.side_length:
+		self.__ensure_solved()
+		if row >= self.side_length or column >= self.side_length or row < 0 or column < 0:
 			raise ValueError(f"{row}, {column} is not a valid position in a puzzle with side length {self.side_length}")
-		return self._solved_grid[row][column]
+		return self._solved_grid[row * self.side_length + column]
 
 	def __set_tile(self, row, column, value, force=False):
 		if value not in self.number_set and not force:
@@ -89,7 +650,91 @@ class SudokuPuzzle:
 				f"{value} is not a valid value in this puzzle. Valid values are: {', '.join(str(x) for x in self.number_set)}")
 		if row >= self.side_length or column >= self.side_length:
 			raise ValueError(f"{row}, {column} is not a valid position in a puzzle with side length {self.side_length}")
-		self._solved_grid[row][column] = value
+		index = row * self.side_length + column
+		subgrid = self.geometry.tile_subgrids[index]
+		old_value = self._solved_grid[index]
+		self._filled += bool(value) - bool(old_value)
+		self._solved_grid[index] = value
+		masks = self._masks
+		if masks is None:
+			return
+		column += self.side_length
+		subgrid += 2 * self.side_length
+		if old_value in self.number_set:
+			bit = 1 << (old_value - 1)
+			masks[row] &= ~bit
+			masks[column] &= ~bit
+			masks[subgrid] &= ~bit
+		if value in self.number_set:
+			bit = 1 << (value - 1)
+			masks[row] |= bit
+			masks[column] |= bit
+			masks[subgrid] |= bit
+
+	def __get_subgrid_index(self, row, column):
+		return self.geometry.tile_subgrids[row * self.side_length + column]
+
+	def __rebuild_masks(self):
+		"""
+		Recalculates the unit bitmasks and the filled tile count from the solved grid.
+		This must be done whenever the solved grid is replaced rather than changed through __set_tile.
+		The masks are 4 bytes each, enough for the 25 bits of a 25x25 puzzle.
+
+		:return: None
+		"""
+		masks = array("I", [0]) * len(self.geometry.units)
+		tile_units = self.geometry.tile_units
+		self._filled = len(self._solved_grid) - self._solved_grid.count(0)
+		for index, value in enumerate(self._solved_grid):
+			if value in self.number_set:
+				bit = 1 << (value - 1)
+				row, column, subgrid = tile_units[index]
+				masks[row] |= bit
+				masks[column] |= bit
+				masks[subgrid] |= bit
+		self._masks = masks
+
+	def __has_repeated_values(self):
+		"""
+		Checks the masks against the solved grid. A unit has a repeated value when it has fewer distinct values
+		than filled tiles, so the masks have fewer bits set in total than the three units of every filled tile.
+
+		:return: True if a value is repeated in a row, column or subgrid. False otherwise.
+		"""
+		return sum(count_bits(mask) for mask in self._masks) != 3 * self._filled
+
+	def get_candidate_mask(self, row, column):
+		"""
+		Returns the values that could be placed in a tile without repeating a value
+		in the same row, column or subgrid, as a bitmask where bit (v - 1) represents the value v.
+
+		:param row: The row of the tile.
+		:param column: The column of the tile.
+		:return: The bitmask of candidate values for the tile.
+		"""
+		index = row * self.side_length + column
+		masks = self._masks
+		if masks is not None:
+			row_unit, column_unit, subgrid_unit = self.geometry.tile_units[index]
+			used = masks[row_unit] | masks[column_unit] | masks[subgrid_unit]
+		else:
+			# outside a solve the masks are gone, so the values are read from the tile and its peers
+			used = 0
+			for tile in (index, *self.geometry.peers[index]):
+				if self._solved_grid[tile]:
+					used |= 1 << (self._solved_grid[tile] - 1)
+		return ((1 << self.side_length) - 1) & ~used
+
+	def get_candidates(self, row, column):
+		"""
+		Returns the values that could be placed in a tile without repeating a value
+		in the same row, column or subgrid.
+
+		:param row: The row of the tile.
+		:param column: The column of the tile.
+		:return: A set of the candidate values for the tile.
+		"""
+		return set(mask_to_values(self.get_candidate_mask(row, column)))
 
 	def __set_subgrid_tile(self, sub_row, sub_col, row, column, value, force=False):
 		"""
@@ -165,18 +810,31 @@ class SudokuPuzzle:
 
 		:return: True if the puzzle contains values it shouldn't. False otherwise.
 		"""
-		invalid = False
-		for i in range(self.side_length):
-			invalid = invalid or any([x not in set.union(self.number_set, {0}) for x in self.get_row(i)])
-		return invalid
+		return any(x not in self.number_set and x != 0 for x in self._solved_grid)
+
+	def generate(self, side_length=9, seed=None):
+		"""
+		Generates a puzzle with a unique solution, rating its difficulty. If a puzzle already exists it will be
+		overwritten. See sudoku_generator to generate many puzzles at once.
 
-	def __generate_puzzle(self):
+		:param side_length: The side length of the puzzle.
+		:param seed: The seed to generate from, or None for a different puzzle every time.
+		:return: None
+		"""
+		self.__generate_puzzle(side_length, seed)
+
+	def __generate_puzzle(self, side_length, seed):
 		"""
 		Generates a solvable sudoku puzzle. If a puzzle already exists it will be overwritten.
 
 		:return: None
 		"""
-		self.__clear_grid()
+		# imported here since the generator is built on this module
+		from sudoku_generator import generate_puzzle
+		data = generate_puzzle(side_length, random.Random(seed))
+		self.__set_grid(data["grid"])
+		# rated with every strategy, which the puzzle's own strategy set may skip
+		self._set_difficulty(data["difficulty"])
 
 	def __clear_grid(self):
 		"""
@@ -185,33 +843,187 @@ class SudokuPuzzle:
 		:return: None
 		"""
 		# a clear grid should always consist of false equivalent values in order for this program to work
-		self._grid = [[0 for i in range(self.side_length)] for j in range(self.side_length)]
-		self._solved_grid = copy.deepcopy(self._grid)
+		self._grid = bytearray(self.side_length * self.side_length)
+		self._solved_grid = bytearray(self._grid)
+		self._masks = None
+		self._filled = 0
 
-	def _set_difficulty(self):
-		self.difficulty = None  # todo
+	def _set_difficulty(self, difficulty):
+		"""
+		:param difficulty: One of DIFFICULTIES, or None while the puzzle has not been rated.
+		:return: None
+		"""
+		if difficulty is not None and difficulty not in DIFFICULTIES:
+			raise ValueError(f"{difficulty} is not a valid difficulty. Valid difficulties are: {', '.join(DIFFICULTIES)}")
+		self.difficulty = difficulty
 
-	def solve(self):
-		change_made = False
+	def solve(self, stats=None):
+		"""
+		Solves the puzzle, filling in the solved grid.
+
+		:param stats: A SolveStats to record the solve into. If None, a new one is used when the puzzle
+		collects stats, and nothing is recorded otherwise.
+		:return: The SolveStats of the solve, or None when stats are not being collected.
+		"""
+		self._solve_pending = False
+		start = time.perf_counter()
+		if stats is None and (self.collect_stats or self.stats_hook is not None):
+			stats = SolveStats()
+		try:
+			# the masks are derived from the solved grid and only kept while solving, which keeps the memory of
+			# every puzzle held between solves down
+			if self._masks is None:
+				self.__rebuild_masks()
+			if self.cache is None:
+				self.__solve(stats)
+			else:
+				self.__solve_cached(stats)
+			logger.info("Solved puzzle in %.3f seconds", time.perf_counter() - start)
+		finally:
+			self._masks = None
+			if stats is not None:
+				self.stats = stats
+				if self.stats_hook is not None:
+					self.stats_hook(stats)
+		return stats
+
+	def __check_cancelled(self):
+		if self.cancel_event is not None and self.cancel_event.is_set():
+			raise SolveCancelledError("The solve was cancelled before it finished.")
+
+	def __rates_every_puzzle(self):
+		"""
+		:return: True if solve rates every puzzle, which needs the heuristic solver with none of its strategies
+		skipped. False otherwise.
+		"""
+		return self.solver == "heuristic" and get_strategy_names(self.side_length, self.strategies) == tuple(
+			STRATEGY_DIFFICULTIES)
+
+	def __solve_cached(self, stats):
+		"""
+		Looks the puzzle, or any symmetry of it, up in the solution cache. The puzzle is only solved
+		when it is not found, and its solution and difficulty are then stored in the cache. An unrated entry,
+		e.g. one stored by the dlx solver, is solved again when this puzzle's solver would rate it.
+
+		:param stats: The SolveStats to record into, or None. The lookup is recorded as the solution_cache strategy.
+		:return: None
+		"""
+		start = time.perf_counter()
+		filled = self._filled
+		cached, form = self.cache.lookup(self.side_length, self._solved_grid)
+		if cached is not None and cached.difficulty is None and self.__rates_every_puzzle():
+			cached = None
+		if cached is not None:
+			self._solved_grid = cached.solution
+			self.__rebuild_masks()
+			self._set_difficulty(cached.difficulty)
+			logger.debug("Found puzzle in the solution cache")
+		if stats is not None:
+			stats.record_strategy("solution_cache", self._filled - filled, time.perf_counter() - start)
+		if cached is None:
+			self.__solve(stats)
+			self.cache.store(form, self._solved_grid, self.difficulty)
+
+	def __solve(self, stats):
+		"""
+		Runs passes of the strategies until the puzzle is full. Each pass tries the strategies in the order of
+		STRATEGY_DIFFICULTIES, leaving out those the puzzle's strategy set skips (see get_strategy_names), and starts
+		the next pass as soon as one of them places or eliminates a value, finally backtracking. The values eliminated
+		from each tile are kept alongside the grid's masks, and every strategy only considers the candidates left.
+		Placements and eliminations are tracked as a work queue: the fill strategies only revisit the tiles and
+		(unit, value) pairs whose candidates could have changed, and the puzzle is full when every tile has been filled.
+
+		:param stats: The SolveStats to record into, or None.
+		:return: None
+		"""
+		full_mask = (1 << self.side_length) - 1
+		tile_count = self.side_length * self.side_length
+		masks = self._masks
+		tile_units = self.geometry.tile_units
+		units = self.geometry.units
+		peers = self.geometry.peers
+		# the values removed from each tile's candidates by the eliminate strategies, on top of its peers' values
+		eliminated = [0] * tile_count
+		eliminations = 0
+		# the values of each unit (numbered as in the geometry) whose valid positions may have changed,
+		# and the empty tiles whose candidates may have changed, since the strategies last checked them
+		dirty_values = [full_mask] * len(self.geometry.units)
+		dirty_tiles = {index for index, value in enumerate(self._solved_grid) if not value}
+
+		def place(index, value):
+			"""
+			Places a value and queues the work it creates: the value can no longer go in the peers of the tile,
+			and no other value can go in the tile.
+
+			:param index: The index of the tile.
+			:param value: The value to place.
+			:return: None
+			"""
+			self.__set_tile(*divmod(index, self.side_length), value)
+			bit = 1 << (value - 1)
+			for unit in tile_units[index]:
+				dirty_values[unit] = full_mask
+			for peer in peers[index]:
+				if not self._solved_grid[peer]:
+					dirty_tiles.add(peer)
+					for unit in tile_units[peer]:
+						dirty_values[unit] |= bit
+
+		def eliminate(candidates, index, mask):
+			"""
+			Removes values from a tile's candidates and queues the work it creates: the values may now have a single
+			valid position in the tile's units, and the tile may have a single candidate left.
+
+			:param candidates: The candidates the strategy is working from, as returned by get_candidates.
+			They are kept up to date.
+			:param index: The index of the tile.
+			:param mask: A bitmask of the values to remove. Values which are not candidates are ignored.
+			:return: None
+			"""
+			nonlocal eliminations
+			mask &= candidates[index]
+			if not mask:
+				return
+			candidates[index] &= ~mask
+			eliminated[index] |= mask
+			eliminations += count_bits(mask)
+			dirty_tiles.add(index)
+			for unit in tile_units[index]:
+				dirty_values[unit] |= mask
+
+		def get_candidates():
+			"""
+			:return: A list of the candidate bitmask of every tile, without the values eliminated from it.
+			Filled tiles have no candidates.
+			"""
+			return [
+				0 if value else full_mask & ~(
+					masks[row] | masks[column] | masks[subgrid] | eliminated[index])
+				for index, (value, (row, column, subgrid)) in enumerate(zip(self._solved_grid, tile_units))]
 
 		def get_valid_positions(value, subgrid_row, subgrid_col):
 			"""
 			This method returns the valid positions of a given value in a given subgrid.
+			Positions are returned as a bitmask where bit (i * sub_side_length + j) represents the tile
+			at row i and column j of the subgrid.
 
 			:param value: The value to find the valid positions for.
 			:param subgrid_row: The row value of the top left corner of the subgrid being searched.
 			:param subgrid_col: The column value of the top left corner of the subgrid being searched.
-			:return: A set of (r,c) tuples which are valid positions for the value to be placed in.
+			:return: A bitmask of the positions which are valid for the value to be placed in.
 			"""
-			valid_positions = set([(x, y) for x in range(self.sub_side_length) for y in range(self.sub_side_length) if
-								   not self.get_tile(x + subgrid_row, y + subgrid_col)])
+			bit = 1 << (value - 1)
+			valid_positions = 0
 			for i in range(self.sub_side_length):
-				if value in self.get_row(subgrid_row + i):
-					valid_positions = valid_positions.difference([(i, x) for x in range(self.sub_side_length)])
-				if value in self.get_column(subgrid_col + i):
-					valid_positions = valid_positions.difference([(x, i) for x in range(self.sub_side_length)])
-			if len(valid_positions) == 0:
-				raise Exception(
+				if masks[subgrid_row + i] & bit:
+					continue
+				row_start = (subgrid_row + i) * self.side_length + subgrid_col
+				for j in range(self.sub_side_length):
+					if not self._solved_grid[row_start + j] and not (
+							masks[self.side_length + subgrid_col + j] | eliminated[row_start + j]) & bit:
+						valid_positions |= 1 << (i * self.sub_side_length + j)
+			if not valid_positions:
+				raise UnsolvablePuzzleError(
 					f"Unable to find valid positions for {value} in subgrid with top left tile row: {subgrid_row} column: {subgrid_col}.")
 			return valid_positions
 
@@ -219,245 +1031,411 @@ class SudokuPuzzle:
 			"""
 			This method checks the valid positions of each number in each subgrid.
 			If there is only one valid position the number will be placed in it.
+			Only the values queued for each subgrid are checked.
 
 			:return: None
 			"""
-			nonlocal change_made
-			for r in range(0, self.side_length, self.sub_side_length):
-				for c in range(0, self.side_length, self.sub_side_length):
-					unplaced_number_set = self.number_set.difference(
-						[x for y in self.get_subgrid(r, c) for x in y if x in self.number_set])
-					for n in unplaced_number_set:
-						valid_places = get_valid_positions(n, r, c)
-						if len(valid_places) == 1:
-							place = valid_places.pop()
-							del valid_places
-							self.__set_tile(r + place[0], c + place[1], n)
-							change_made = True
+			for subgrid, (r, c) in enumerate(self.geometry.subgrid_origins):
+				unit = 2 * self.side_length + subgrid
+				unplaced_number_mask = dirty_values[unit] & ~masks[unit]
+				dirty_values[unit] = 0
+				for n in mask_to_values(unplaced_number_mask):
+					if masks[unit] & (1 << (n - 1)):
+						continue
+					valid_places = get_valid_positions(n, r, c)
+					if not valid_places & (valid_places - 1):
+						place_index = valid_places.bit_length() - 1
+						i, j = divmod(place_index, self.sub_side_length)
+						place((r + i) * self.side_length + c + j, n)
 
 		def fill_singleton_possibilities():
 			"""
-			This method iterates over each tile and applies a set of possible values to the tile based on
-			what is in the same subgrid, row and column as that tile. If the set of values is a singleton then
-			the singleton value is placed in the tile.
+			This method iterates over each queued tile and finds the possible values for the tile based on
+			what is in the same subgrid, row and column as that tile. If there is only one possible value
+			then that value is placed in the tile.
 
 			:return: None
 			"""
-			nonlocal change_made
-			for r in range(self.side_length):
-				for c in range(self.side_length):
-					if not self.get_tile(r, c):
-						# (c,r) are the coordinates of a single empty tile
-						possible_number_set = self.number_set.difference(
-							[x for y in self.get_subgrid(r, c) for x in y if x in self.number_set])
-						possible_number_set = possible_number_set.difference(
-							[x for x in self.get_row(r) if x in self.number_set])
-						possible_number_set = possible_number_set.difference(
-							[x for x in self.get_column(c) if x in self.number_set])
-
-						if len(possible_number_set) == 0:
-							raise Exception(f"Unable to place a value in row: {r} column {c}. It is impossible")
-						elif len(possible_number_set) == 1:
-							self.__set_tile(r, c, possible_number_set.pop())
-							change_made = True
+			tiles = sorted(dirty_tiles)
+			dirty_tiles.clear()
+			for index in tiles:
+				if not self._solved_grid[index]:
+					# (r,c) are the coordinates of a single empty tile
+					r, c = divmod(index, self.side_length)
+					possible_number_mask = self.get_candidate_mask(r, c) & ~eliminated[index]
+					if not possible_number_mask:
+						raise UnsolvablePuzzleError(f"Unable to place a value in row: {r} column {c}. It is impossible")
+					elif not possible_number_mask & (possible_number_mask - 1):
+						place(index, possible_number_mask.bit_length())
 
 		def fill_known_row_column_values():
 			"""
 			This method checks the valid positions of each number in each row/column.
 			If there is only one valid position the number will be placed in it.
+			Only the values queued for each row/column are checked.
 
 			:return: None
 			"""
-			nonlocal change_made
-			for n in self.number_set:
-				for i in range(self.side_length):
-					# * n = a value from the number set
-					# * i = an index along the row/column
-					if n not in self.get_row(i):
-						# take all indexes in the row
-						valid_row_indexes = set(range(self.side_length))
-						# remove indexes where there is already a value
-						valid_row_indexes = valid_row_indexes.difference(
-							[x for x in range(self.side_length) if self.get_row(i)[x] in self.number_set])
-						# remove indexes where n conflicts with itself in that column
-						valid_row_indexes = valid_row_indexes.difference(
-							[x for x in range(self.side_length) if n in self.get_column(x)])
-						# remove indexes where n conflicts with itself in that subgrid
-						valid_row_indexes = valid_row_indexes.difference(
-							[x for x in range(self.side_length) if n in [y for z in self.get_subgrid(i, x) for y in z]])
-						if len(valid_row_indexes) == 0:
-							raise Exception(f"Unable to place {n} in row: {i}. It is impossible")
-						elif len(valid_row_indexes) == 1:
-							index = valid_row_indexes.pop()
-							self.__set_tile(i, index, n)
-							change_made = True
-
-					if n not in self.get_column(i):
-						# take all indexes in the column
-						valid_column_indexes = set(range(self.side_length))
-						# remove indexes where there is already a value
-						valid_column_indexes = valid_column_indexes.difference(
-							[x for x in range(self.side_length) if self.get_column(i)[x] in self.number_set])
-						# remove indexes where n conflicts with itself in that column
-						valid_column_indexes = valid_column_indexes.difference(
-							[x for x in range(self.side_length) if n in self.get_row(x)])
-						# remove indexes where n conflicts with itself in that subgrid
-						valid_column_indexes = valid_column_indexes.difference(
-							[x for x in range(self.side_length) if n in [y for z in self.get_subgrid(x, i) for y in z]])
-						if len(valid_column_indexes) == 0:
-							raise Exception(f"Unable to place {n} in column: {i}. It is impossible")
-						elif len(valid_column_indexes) == 1:
-							index = valid_column_indexes.pop()
-							self.__set_tile(index, i, n)  # probably where the error is
-							change_made = True
-
-		def fill_based_on_multiple_value_possibilities():
-			nonlocal change_made
-			for r in range(0, self.side_length, self.sub_side_length):
-				for c in range(0, self.side_length, self.sub_side_length):
-					# r is the subgrid row number
-					# c is the subgrid column number
-					# both go up in steps of self.sub_side_length
-					def fill_multiple_value_tiles():
-						position_map = {}
-						unplaced_number_set = self.number_set.difference(
-							[x for y in self.get_subgrid(r, c) for x in y if isinstance(x, int)])
-						unplaced_number_set = unplaced_number_set.difference(
-							[x for y in self.get_subgrid(r, c) for z in y if isinstance(z, set) for x in z])
-						for n in unplaced_number_set:
-							valid_places = get_valid_positions(n, r, c)
-							position_map.update({n: valid_places})
-						for n, p in position_map.items():
-							identical_list = [x for x in position_map.items() if x[1] == p]
-							if len(identical_list) > 1 and len(identical_list) == len(identical_list[0][1]):
-								for i in identical_list[0][1]:
-									self.__set_tile(r + i[0], c + i[1], set([x for x, _ in identical_list]), force=True)
-								fill_multiple_value_tiles()
-								break
-
-					def clear_multiple_value_tiles():
-						for i in range(0, self.sub_side_length, 1):
-							for j in range(0, self.sub_side_length, 1):
-								if isinstance(self.get_tile(r + i, c + j), set):
-									self.__set_tile(r + i, c + j, 0, force=True)
-
-					fill_multiple_value_tiles()
-
-					unplaced_number_set = self.number_set.difference(
-						[x for y in self.get_subgrid(r, c) for x in y if x in self.number_set])
-					unplaced_number_set = unplaced_number_set.difference(
-						[x for y in self.get_subgrid(r, c) for z in y if isinstance(z, set) for x in z])
-					for n in unplaced_number_set:
-						valid_places = get_valid_positions(n, r, c)
-						if len(valid_places) == 1:
-							place = valid_places.pop()
-							del valid_places
-							self.__set_tile(r + place[0], c + place[1], n)
-							change_made = True
-
-					if not self.get_tile(r, c):
-						# (c,r) are the coordinates of a single empty tile
-						possible_number_set = self.number_set.difference(
-							[x for y in self.get_subgrid(r, c) for x in y if x in self.number_set])
-						possible_number_set = possible_number_set.difference(
-							[x for y in self.get_subgrid(r, c) for z in y if isinstance(z, set) for x in z])
-						possible_number_set = possible_number_set.difference(
-							[x for x in self.get_row(r) if x in self.number_set])
-						possible_number_set = possible_number_set.difference(
-							[x for x in self.get_column(c) if x in self.number_set])
-
-						if len(possible_number_set) == 0:
-							raise Exception(f"Unable to place a value in row: {r} column {c}. It is impossible")
-						elif len(possible_number_set) == 1:
-							self.__set_tile(r, c, possible_number_set.pop())
-							change_made = True
-
-					clear_multiple_value_tiles()
-
-		def backtracking_solve(possibility_map=None):
-			def generate_possibility_map():
-				return [[[x for x in self.number_set if x not in self.get_row(r) if x not in self.get_column(c) if
-						  x not in [y for z in self.get_subgrid(r, c) for y in z]] for c in range(self.side_length)] for
-						r in
-						range(self.side_length)]
-
-			def update_possibility_map(old_map, row, column, inserted):
-				updated_map = copy.deepcopy(old_map)
-				for i in range(self.side_length):
-					try:
-						updated_map[row][i].remove(inserted)
-					except ValueError:
-						pass
-					try:
-						updated_map[i][column].remove(inserted)
-					except ValueError:
-						pass
-				sub_row = (row // self.sub_side_length) * self.sub_side_length
-				sub_col = (column // self.sub_side_length) * self.sub_side_length
-				for i in range(self.sub_side_length):
-					for j in range(self.sub_side_length):
-						try:
-							updated_map[sub_row + i][sub_col + j].remove(inserted)
-						except ValueError:
-							pass
-				return updated_map
-
-			if not possibility_map:
-				possibility_map = generate_possibility_map()
-
-			def all_squares_possible(covering_map):
-				for r in range(self.side_length):
-					for c in range(self.side_length):
-						if not self.get_tile(r, c) and len(covering_map[r][c]) == 0:
-							return False
-				return True
-
-			for r in range(self.side_length):
-				for c in range(self.side_length):
-					if not self.get_tile(r, c):
-						for value in possibility_map[r][c]:
-							self.__set_tile(r, c, value)
-							new_map = update_possibility_map(possibility_map, r, c, value)
-							if all_squares_possible(new_map):
-								if backtracking_solve(possibility_map=new_map):
-									return True
-							self.__set_tile(r, c, 0, force=True)
-						# value = possibility_map[r][c].pop()
-						return False
-			return True
+			for i in range(self.side_length):
+				# * i = an index along the row/column
+				# * n = a value from the number set
+				unplaced_number_mask = dirty_values[i] & ~masks[i]
+				dirty_values[i] = 0
+				row_start = i * self.side_length
+				for n in mask_to_values(unplaced_number_mask):
+					bit = 1 << (n - 1)
+					if masks[i] & bit:
+						continue
+					# take the indexes in the row which are empty and where n doesn't conflict
+					# with itself in that column or subgrid
+					valid_row_indexes = [
+						x for x in range(self.side_length)
+						if not self._solved_grid[row_start + x] and not (
+							masks[self.side_length + x] | masks[tile_units[row_start + x][2]] | eliminated[row_start + x]) & bit]
+					if len(valid_row_indexes) == 0:
+						raise UnsolvablePuzzleError(f"Unable to place {n} in row: {i}. It is impossible")
+					elif len(valid_row_indexes) == 1:
+						place(row_start + valid_row_indexes[0], n)
+
+				unit = self.side_length + i
+				unplaced_number_mask = dirty_values[unit] & ~masks[unit]
+				dirty_values[unit] = 0
+				for n in mask_to_values(unplaced_number_mask):
+					bit = 1 << (n - 1)
+					if masks[unit] & bit:
+						continue
+					# take the indexes in the column which are empty and where n doesn't conflict
+					# with itself in that row or subgrid
+					valid_column_indexes = [
+						x for x in range(self.side_length)
+						if not self._solved_grid[x * self.side_length + i] and not (
+							masks[x] | masks[tile_units[x * self.side_length + i][2]] | eliminated[x * self.side_length + i]) & bit]
+					if len(valid_column_indexes) == 0:
+						raise UnsolvablePuzzleError(f"Unable to place {n} in column: {i}. It is impossible")
+					elif len(valid_column_indexes) == 1:
+						place(valid_column_indexes[0] * self.side_length + i, n)
+
+		def eliminate_intersections(line_units, kinds):
+			"""
+			Where the tiles of a unit which can hold a value all lie in one unit of another kind, the value has to go
+			in the intersection of the two units, so it is removed from the rest of the other unit.
+
+			:param line_units: The numbers of the units to look for values in.
+			:param kinds: The kinds of unit the tiles can share: 0 for rows, 1 for columns and 2 for subgrids.
+			:return: None
+			"""
+			candidates = get_candidates()
+			for unit in line_units:
+				unit_kind = unit // self.side_length
+				for kind in kinds:
+					# other unit -> the candidates of the tiles the unit shares with it
+					segments = {}
+					for index in units[unit]:
+						other = tile_units[index][kind]
+						segments[other] = segments.get(other, 0) | candidates[index]
+					for other, segment in segments.items():
+						rest = 0
+						for other_unit, other_segment in segments.items():
+							if other_unit != other:
+								rest |= other_segment
+						only = segment & ~rest
+						if only:
+							for index in units[other]:
+								if tile_units[index][unit_kind] != unit:
+									eliminate(candidates, index, only)
+
+		def eliminate_pointing_candidates():
+			"""
+			This method looks for pointing pairs and triples: values whose valid positions in a subgrid all lie in
+			one row or column. The value is removed from the rest of that row or column.
+
+			:return: None
+			"""
+			eliminate_intersections(range(2 * self.side_length, 3 * self.side_length), (0, 1))
+
+		def eliminate_box_line_reductions():
+			"""
+			This method looks for values whose valid positions in a row or column all lie in one subgrid.
+			The value is removed from the rest of that subgrid.
+
+			:return: None
+			"""
+			eliminate_intersections(range(2 * self.side_length), (2,))
+
+		def eliminate_naked_subsets():
+			"""
+			This method looks for naked pairs, triples and quads in every unit: n tiles whose candidates between them
+			are only n values. The values have to go in those tiles, so they are removed from the rest of the unit.
+			Smaller subsets are looked for first, moving on to the next unit after the first size which
+			eliminates a value.
+
+			:return: None
+			"""
+			candidates = get_candidates()
+			for unit_tiles in units:
+				empty = [index for index in unit_tiles if candidates[index]]
+				if len(empty) < 3:
+					continue
+				candidate_counts = [count_bits(candidates[index]) for index in empty]
+				before = eliminations
+				for size in range(2, min(MAX_SUBSET_SIZE, len(empty) - 1) + 1):
+					small = [index for index, count in zip(empty, candidate_counts) if count <= size]
+					for subset in itertools.combinations(small, size):
+						values = 0
+						for index in subset:
+							values |= candidates[index]
+						if count_bits(values) == size:
+							for index in empty:
+								if index not in subset:
+									eliminate(candidates, index, values)
+					if eliminations > before:
+						break
+
+		def eliminate_hidden_subsets():
+			"""
+			This method looks for hidden pairs, triples and quads in every unit: n values whose valid positions
+			between them are only n tiles. Those tiles have to hold the values, so every other value is removed
+			from them. Smaller subsets are looked for first, moving on to the next unit after the first size which
+			eliminates a value.
+
+			:return: None
+			"""
+			candidates = get_candidates()
+			for unit_tiles in units:
+				empty = [index for index in unit_tiles if candidates[index]]
+				if len(empty) < 3:
+					continue
+				# value -> bitmask of its valid positions, where bit i represents the tile empty[i]
+				positions = {}
+				for i, index in enumerate(empty):
+					for value in mask_to_values(candidates[index]):
+						positions[value] = positions.get(value, 0) | 1 << i
+				position_counts = {value: count_bits(value_positions) for value, value_positions in positions.items()}
+				before = eliminations
+				for size in range(2, min(MAX_SUBSET_SIZE, len(empty) - 1) + 1):
+					few = [value for value, count in position_counts.items() if count <= size]
+					for subset in itertools.combinations(few, size):
+						subset_positions = 0
+						values = 0
+						for value in subset:
+							subset_positions |= positions[value]
+							values |= 1 << (value - 1)
+						if count_bits(subset_positions) == size:
+							for i in mask_to_values(subset_positions):
+								eliminate(candidates, empty[i - 1], ~values)
+					if eliminations > before:
+						break
+
+		def eliminate_fish():
+			"""
+			This method looks for X-Wings and Swordfish: n rows in which a value can only go in the same n columns.
+			The value has to go in those columns in those rows, so it is removed from the rest of the columns,
+			and the same with rows and columns swapped. X-Wings are looked for before Swordfish for each value.
+
+			:return: None
+			"""
+			candidates = get_candidates()
+			n = self.side_length
+			for value in self.number_set:
+				bit = 1 << (value - 1)
+				# rows against columns, then columns against rows
+				for base, cover in ((0, 1), (1, 0)):
+					# line -> bitmask of the value's valid positions along it
+					lines = {}
+					for line in range(n):
+						line_positions = 0
+						for position, index in enumerate(units[base * n + line]):
+							if candidates[index] & bit:
+								line_positions |= 1 << position
+						if 1 < count_bits(line_positions) <= MAX_FISH_SIZE:
+							lines[line] = line_positions
+					before = eliminations
+					for size in range(2, MAX_FISH_SIZE + 1):
+						for subset in itertools.combinations(lines, size):
+							cover_positions = 0
+							for line in subset:
+								cover_positions |= lines[line]
+							if count_bits(cover_positions) == size:
+								for position in mask_to_values(cover_positions):
+									for index in units[cover * n + position - 1]:
+										if tile_units[index][base] - base * n not in subset:
+											eliminate(candidates, index, bit)
+						if eliminations > before:
+							break
+
+		def backtracking_solve():
+			"""
+			This method searches for a solution by trying candidate values in the order given by search_order.
+			The search runs on a CandidateGrid which is changed in place and undone on backtrack,
+			and the solution found is copied into the solved grid.
+
+			:return: None
+			"""
+			candidate_grid = CandidateGrid(self.side_length, self._solved_grid, self.cancel_event)
+			# start the search from the candidates left by the eliminate strategies
+			for index, mask in enumerate(eliminated):
+				if mask and candidate_grid.candidates[index] & mask:
+					candidate_grid.candidates[index] &= ~mask
+					if not candidate_grid.candidates[index] & (candidate_grid.candidates[index] - 1):
+						candidate_grid.singles.append(index)
+						candidate_grid.consistent = candidate_grid.consistent and bool(candidate_grid.candidates[index])
+			if self.workers > 1:
+				solution = self.__parallel_search(candidate_grid, 1, stats).solution
+			else:
+				try:
+					solution = candidate_grid.values if candidate_grid.search(self.search_order) else None
+				finally:
+					if stats is not None:
+						stats.record_search(candidate_grid.nodes, candidate_grid.max_depth)
+			if solution is None:
+				self.__check_cancelled()
+				raise UnsolvablePuzzleError("The puzzle that is trying to be solved has no solution.")
+			for index, value in enumerate(solution):
+				if not self._solved_grid[index]:
+					self.__set_tile(*divmod(index, self.side_length), value)
+
+		def exact_cover_solve():
+			"""
+			This method solves the puzzle with dancing links and copies the solution into the solved grid.
+
+			:return: None
+			"""
+			solutions = sudoku_solutions(self.side_length, self._solved_grid, stats, self.cancel_event)
+			solution = next(solutions, None)
+			solutions.close()
+			if solution is None:
+				self.__check_cancelled()
+				raise UnsolvablePuzzleError("The puzzle that is trying to be solved has no solution.")
+			for index, value in enumerate(solution):
+				if not self._solved_grid[index]:
+					self.__set_tile(*divmod(index, self.side_length), value)
+
+		def run(strategy):
+			"""
+			Runs a strategy, recording its time and the number of tiles it filled and candidates it eliminated
+			when stats are being collected.
+
+			:param strategy: The strategy function to run.
+			:return: None
+			"""
+			if stats is None:
+				strategy()
+				return
+			filled = self._filled
+			eliminated_before = eliminations
+			start = time.perf_counter()
+			try:
+				strategy()
+			finally:
+				stats.record_strategy(
+					strategy.__name__, self._filled - filled, time.perf_counter() - start, eliminations - eliminated_before)
 
 		if self.contains_invalid_values():
-			raise Exception("The puzzle that is trying to be solved is invalid and will not have a solution.")
+			raise UnsolvablePuzzleError("The puzzle that is trying to be solved is invalid and will not have a solution.")
 
-		fill_known_subgrid_values()
-		if self.is_complete():
-			# print("SOLVED")
-			return None
-		fill_singleton_possibilities()
-		if self.is_complete():
-			# print("SOLVED")
+		if self.solver == "dlx":
+			self.__check_cancelled()
+			run(exact_cover_solve)
 			return None
-		fill_known_row_column_values()
-		if self.is_complete():
-			# print("SOLVED")
-			return None
-		if not change_made:
-			fill_based_on_multiple_value_possibilities()
-			if self.is_complete():
-				return None
 
-		if not change_made:
-			backtracking_solve()
-		# raise Exception("The solving algorithm has insufficient ability to solve this puzzle.")
+		strategy_functions = {strategy.__name__: strategy for strategy in (
+			fill_known_subgrid_values,
+			fill_singleton_possibilities,
+			fill_known_row_column_values,
+			eliminate_pointing_candidates,
+			eliminate_box_line_reductions,
+			eliminate_naked_subsets,
+			eliminate_hidden_subsets,
+			eliminate_fish,
+			backtracking_solve,
+		)}
+		strategies = tuple(
+			strategy_functions[name] for name in get_strategy_names(self.side_length, self.strategies))
+		hardest = -1
+		# every placement is checked against the tile's candidates, so the puzzle is complete as soon as it is full
+		while self._filled < tile_count:
+			self.__check_cancelled()
+			if stats is not None:
+				stats.passes += 1
+			# each pass stops at the first strategy to place or eliminate a value, so harder strategies only run
+			# when needed
+			for level, strategy in enumerate(strategies):
+				progress = self._filled, eliminations
+				run(strategy)
+				if (self._filled, eliminations) != progress:
+					hardest = max(hardest, level)
+					break
+		# a puzzle which needed the search when strategies were skipped might not have needed it with them
+		if hardest >= 0 and (strategies[hardest] is not backtracking_solve or self.__rates_every_puzzle()):
+			self._set_difficulty(STRATEGY_DIFFICULTIES[strategies[hardest].__name__])
+		return None
+
+	def count_solutions(self, limit=2):
+		"""
+		Counts the solutions of the puzzle's grid using the puzzle's solver, stopping as soon as
+		the limit is reached. With the default limit of 2 this is enough to tell whether the solution is unique.
+
+		:param limit: The number of solutions to stop counting at. At least 2 are needed to tell unique from multiple.
+		:return: A SolutionCount with the status, the number of solutions found and the first solution found.
+		"""
+		if limit < 2:
+			raise ValueError(f"Expected the solution limit to be at least 2, actual limit: {limit}")
+		values = list(self._grid)
+		count = 0
+		first_solution = None
+		if self.solver == "heuristic" and self.workers > 1:
+			result = self.__parallel_search(CandidateGrid(self.side_length, values), limit)
+			count = result.count
+			if result.solution is not None:
+				first_solution = [
+					list(result.solution[i:i + self.side_length]) for i in range(0, len(values), self.side_length)]
 		else:
-			self.solve()
+			if self.solver == "dlx":
+				solutions = sudoku_solutions(self.side_length, values, cancel_event=self.cancel_event)
+			else:
+				candidate_grid = CandidateGrid(self.side_length, values, self.cancel_event)
+				solutions = (list(candidate_grid.values) for _ in candidate_grid.solutions(self.search_order))
+			for solution in itertools.islice(solutions, limit):
+				if first_solution is None:
+					first_solution = [solution[i:i + self.side_length] for i in range(0, len(solution), self.side_length)]
+				count += 1
+		# a cancelled search stops early, so its count can't be trusted
+		if count < limit:
+			self.__check_cancelled()
+
+		if count == 0:
+			status = NO_SOLUTION
+		elif count == 1:
+			status = UNIQUE_SOLUTION
+		else:
+			status = MULTIPLE_SOLUTIONS
+		return SolutionCount(status, count, first_solution)
+
+	def __parallel_search(self, candidate_grid, limit, stats=None):
+		"""
+		Searches a grid across the puzzle's worker processes.
+
+		:param candidate_grid: The CandidateGrid to search.
+		:param limit: The number of solutions to stop at.
+		:param stats: The SolveStats to record the search into, or None.
+		:return: A sudoku_parallel.ParallelSearchResult.
+		"""
+		# imported here since sudoku_parallel is built on this module
+		from sudoku_parallel import parallel_search
+		result = parallel_search(
+			candidate_grid, limit, self.workers, self.search_order, cancel_event=self.cancel_event)
+		if stats is not None:
+			stats.record_search(result.nodes, result.max_depth)
+		return result
 
 	def get_as_serialized_dict(self):
+		self.__ensure_solved()
+		n = self.side_length
 		data = {
-			"side length": self.side_length,
+			"side length": n,
 			"difficulty": self.difficulty,
-			"grid": self._grid,
-			"solved grid": self._solved_grid
+			"grid": [list(self._grid[i:i + n]) for i in range(0, n * n, n)],
+			"solved grid": [list(self._solved_grid[i:i + n]) for i in range(0, n * n, n)]
 		}
 		return data
 
@@ -466,6 +1444,7 @@ class SudokuPuzzle:
 
 
 def main():
+	logging.basicConfig(level=logging.INFO, format="%(message)s")
 	puzzles_data = {"puzzles": []}
 
 	def add_to_puzzles(new_puzzle):